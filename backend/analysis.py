@@ -0,0 +1,315 @@
+"""Document analysis with Ollama: summary and keywords, map-reduce over long texts with
+cached chunk results, and the analyze_document job.
+"""
+from fastapi import HTTPException, BackgroundTasks
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from typing import Optional, List, Tuple
+import os
+import asyncio
+import json
+import hashlib
+
+from config import (
+    CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, MAPREDUCE_CONCURRENCY, MAPREDUCE_MAX_PASSES, MAX_KEYWORDS,
+    OLLAMA_ANALYSIS_MODE, OLLAMA_MODEL, SUMMARY_STRATEGY, UPLOAD_DIR,
+)
+from database import db_session, release_connection
+from models import ANALYSIS_FAILED, AnalysisChunk, Document, refresh_search_vectors
+from response_cache import documents_changed
+from blobs import file_url
+from jobs import JOB_HANDLERS, PermanentJobError
+from ollama_client import ollama
+from extraction import get_document_text
+from vectors import index_document_embedding
+
+async def find_cached_analysis(db: AsyncSession, sha256: Optional[str], exclude_id: Optional[int] = None) -> Optional[dict]:
+    """Summary/keywords already computed for another document with identical content."""
+    if not sha256:
+        return None
+    query = select(Document.ai_summary, Document.ai_keywords).where(
+        Document.sha256 == sha256,
+        Document.ai_summary.isnot(None),
+        Document.ai_summary != "",
+        Document.ai_summary != ANALYSIS_FAILED,
+    )
+    if exclude_id is not None:
+        query = query.where(Document.id != exclude_id)
+    row = (await db.execute(query.limit(1))).first()
+    if row is None:
+        return None
+    return {"summary": row.ai_summary, "keywords": row.ai_keywords or ""}
+
+SUMMARY_PROMPT = "Summarize the following document in French in 3-4 sentences:\n\n{text}"
+KEYWORDS_PROMPT = "Extract 8-10 key words/phrases from this text in French, separated by commas:\n\n{text}"
+ANALYSIS_JSON_PROMPT = (
+    "Analyze the following document. Answer in French with a JSON object of the form "
+    '{{"summary": "<3-4 sentence summary>", "keywords": ["<8-10 key words or phrases>"]}}.\n\n{text}'
+)
+
+def parse_json_analysis(raw: str) -> dict:
+    data = json.loads(raw)
+    keywords = data.get("keywords", "")
+    if isinstance(keywords, list):
+        keywords = ", ".join(str(k).strip() for k in keywords if str(k).strip())
+    return {"summary": str(data.get("summary", "")).strip(), "keywords": str(keywords).strip()}
+
+ANALYSIS_EXCERPT_CHARS = 2000
+
+async def analyze_with_ollama(text: str, background_tasks: BackgroundTasks) -> dict:
+    excerpt = text[:ANALYSIS_EXCERPT_CHARS]
+    try:
+        if OLLAMA_ANALYSIS_MODE == "json":
+            data = await ollama.generate(ANALYSIS_JSON_PROMPT.format(text=excerpt), format="json")
+            return parse_json_analysis(data.get("response", ""))
+
+        summary, keywords = await asyncio.gather(
+            ollama.generate(SUMMARY_PROMPT.format(text=excerpt)),
+            ollama.generate(KEYWORDS_PROMPT.format(text=excerpt)),
+        )
+        return {
+            "summary": summary.get("response", "").strip(),
+            "keywords": keywords.get("response", "").strip()
+        }
+    except Exception as e:
+        print(f"Ollama error: {e}")
+    
+    return {"summary": ANALYSIS_FAILED, "keywords": ""}
+
+# ---------- map-reduce for long documents ----------
+MAP_PROMPT = (
+    "Summarize this excerpt of a longer document in French in 2-3 sentences and extract up to 8 "
+    'key words/phrases in French. Answer with a JSON object of the form '
+    '{{"summary": "...", "keywords": ["..."]}}.\n\n{text}'
+)
+REDUCE_PROMPT = (
+    "The following are summaries of consecutive parts of one document. "
+    "Combine them into a single summary in French in {sentences} sentences:\n\n{text}"
+)
+
+def estimate_tokens(word: str) -> int:
+    # ~4 characters per token is close enough for Mistral on French text
+    return max(1, (len(word) + 3) // 4)
+
+def split_into_chunks(text: str, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """Split text on word boundaries into chunks of at most max_tokens, overlapping by ~overlap_tokens."""
+    words = text.split()
+    chunks = []
+    start = 0
+    while start < len(words):
+        end, tokens = start, 0
+        while end < len(words) and (end == start or tokens + estimate_tokens(words[end]) <= max_tokens):
+            tokens += estimate_tokens(words[end])
+            end += 1
+        chunks.append(" ".join(words[start:end]))
+        if end >= len(words):
+            break
+        next_start, overlap = end, 0
+        while next_start > start + 1 and overlap < overlap_tokens:
+            next_start -= 1
+            overlap += estimate_tokens(words[next_start])
+        start = next_start
+    return chunks
+
+def merge_keywords(keyword_lists: List[str], limit: int = MAX_KEYWORDS) -> str:
+    """Comma-separated keywords ranked by how many chunks mention them, case-insensitively deduplicated."""
+    counts, first_seen = {}, {}
+    for keywords in keyword_lists:
+        for keyword in (keywords or "").split(","):
+            keyword = keyword.strip().strip(".")
+            if not keyword:
+                continue
+            norm = keyword.lower()
+            counts[norm] = counts.get(norm, 0) + 1
+            first_seen.setdefault(norm, keyword)
+    ranked = sorted(counts, key=lambda k: -counts[k])
+    return ", ".join(first_seen[k] for k in ranked[:limit])
+
+def chunk_cache_key(stage: str, text: str) -> str:
+    return hashlib.sha256(f"{OLLAMA_MODEL}\0{stage}\0{text}".encode("utf-8")).hexdigest()
+
+async def load_cached_chunks(db: AsyncSession, keys: List[str]) -> dict:
+    cached = {}
+    for i in range(0, len(keys), 500):
+        rows = (await db.execute(select(AnalysisChunk).where(AnalysisChunk.key.in_(keys[i:i + 500])))).scalars().all()
+        cached.update({row.key: {"summary": row.summary or "", "keywords": row.keywords or ""} for row in rows})
+    return cached
+
+async def store_cached_chunks(results: dict):
+    """Persist new step outputs in their own transaction; concurrent duplicates are ignored."""
+    if not results:
+        return
+    async with db_session() as cache_db:
+        existing = await load_cached_chunks(cache_db, list(results))
+        for key, value in results.items():
+            if key not in existing:
+                cache_db.add(AnalysisChunk(key=key, summary=value["summary"], keywords=value["keywords"]))
+        try:
+            await cache_db.commit()
+        except IntegrityError:
+            await cache_db.rollback()
+
+async def run_cached_steps(db: AsyncSession, stage: str, inputs: List[str], step) -> List[dict]:
+    """Run step(text) for every input with bounded concurrency, reusing cached outputs."""
+    keys = [chunk_cache_key(stage, text) for text in inputs]
+    cached = await load_cached_chunks(db, keys)
+    await release_connection(db)
+    semaphore = asyncio.Semaphore(MAPREDUCE_CONCURRENCY)
+    fresh = {}
+
+    async def run(key: str, text: str) -> dict:
+        if key in cached:
+            return cached[key]
+        async with semaphore:
+            result = await step(text)
+        fresh[key] = result
+        return result
+
+    try:
+        return await asyncio.gather(*(run(key, text) for key, text in zip(keys, inputs)))
+    finally:
+        # keep whatever finished so a retry only recomputes what failed
+        await store_cached_chunks(fresh)
+
+async def map_chunk(text: str) -> dict:
+    data = await ollama.generate(MAP_PROMPT.format(text=text), format="json")
+    try:
+        return parse_json_analysis(data.get("response", ""))
+    except ValueError:
+        return {"summary": data.get("response", "").strip(), "keywords": ""}
+
+async def reduce_summaries(text: str, sentences: str) -> dict:
+    data = await ollama.generate(REDUCE_PROMPT.format(text=text, sentences=sentences))
+    return {"summary": data.get("response", "").strip(), "keywords": ""}
+
+async def map_and_fold(db: AsyncSession, text: str) -> Tuple[str, str]:
+    """Summarize every chunk and fold the summaries until they fit one prompt; returns (final input, keywords).
+
+    Folding stops after MAPREDUCE_MAX_PASSES or once a pass no longer shrinks the
+    input; whatever is still too long is trimmed.
+    """
+    chunks = split_into_chunks(text)
+    mapped = await run_cached_steps(db, "map", chunks, map_chunk)
+    keywords = merge_keywords([m["keywords"] for m in mapped])
+
+    def size(parts: List[str]) -> int:
+        return sum(estimate_tokens(w) for s in parts for w in s.split())
+
+    summaries = [m["summary"] for m in mapped if m["summary"]]
+    tokens = size(summaries)
+    for _ in range(MAPREDUCE_MAX_PASSES):
+        if len(summaries) <= 1 or tokens <= CHUNK_TOKENS:
+            break
+        groups = split_into_chunks("\n\n".join(summaries), CHUNK_TOKENS, 0)
+        reduced = await run_cached_steps(db, "reduce", groups, lambda t: reduce_summaries(t, "4-6"))
+        folded = [r["summary"] for r in reduced if r["summary"]]
+        # a model that answers at length can stop shrinking the input; folding again would never end
+        if not folded or size(folded) >= tokens:
+            break
+        summaries, tokens = folded, size(folded)
+    if tokens > CHUNK_TOKENS:
+        # keep the start of summaries spread over the whole document rather than only the first ones
+        keep = min(len(summaries), max(1, CHUNK_TOKENS // 50))
+        summaries = [summaries[i * len(summaries) // keep] for i in range(keep)]
+        budget = CHUNK_TOKENS // keep
+        summaries = [(split_into_chunks(s, budget, 0) or [""])[0] for s in summaries]
+    return "\n\n".join(summaries), keywords
+
+async def analyze_long_text(db: AsyncSession, text: str) -> dict:
+    """Map-reduce analysis: summarize every chunk, then fold the summaries level by level."""
+    final_input, keywords = await map_and_fold(db, text)
+    final = await run_cached_steps(db, "final", [final_input], lambda t: reduce_summaries(t, "3-4"))
+    return {"summary": final[0]["summary"], "keywords": keywords}
+
+async def analyze_text(db: AsyncSession, text: str, background_tasks: Optional[BackgroundTasks] = None) -> dict:
+    if SUMMARY_STRATEGY != "mapreduce" or len(text) <= ANALYSIS_EXCERPT_CHARS:
+        await release_connection(db)
+        return await analyze_with_ollama(text, background_tasks or BackgroundTasks())
+    try:
+        return await analyze_long_text(db, text)
+    except Exception as e:
+        print(f"Ollama map-reduce error: {e}")
+    return {"summary": ANALYSIS_FAILED, "keywords": ""}
+
+async def persist_analysis(db: AsyncSession, doc: Document, analysis: dict, text: Optional[str] = None):
+    """Store summary/keywords on doc, refresh its search vector and embedding."""
+    doc.ai_summary = analysis.get("summary", "")
+    doc.ai_keywords = analysis.get("keywords", "")
+    await db.flush()
+    await refresh_search_vectors(db, Document.id == doc.id)
+    await db.commit()
+    await documents_changed(doc.id)
+    await index_document_embedding(db, doc, text)
+
+async def run_document_analysis(db: AsyncSession, doc: Document, background_tasks: Optional[BackgroundTasks] = None) -> dict:
+    """Extract + analyze the stored file of doc and persist the result."""
+    file_path = os.path.join(UPLOAD_DIR, doc.file_path)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="Uploaded file not found")
+
+    analysis = await find_cached_analysis(db, doc.sha256, exclude_id=doc.id)
+    if analysis is None:
+        max_chars = None if SUMMARY_STRATEGY == "mapreduce" else ANALYSIS_EXCERPT_CHARS
+        text = await get_document_text(db, doc, max_chars=max_chars)
+        analysis = await analyze_text(db, text, background_tasks)
+
+    await persist_analysis(db, doc, analysis)
+
+    return {
+        "document_id": doc.id,
+        "summary": doc.ai_summary,
+        "keywords": doc.ai_keywords,
+        "file_url": file_url(doc.id, doc.file_path)
+    }
+
+async def stream_text_analysis(db: AsyncSession, text: str, result: dict):
+    """Yield (event, data) pairs while the summary is generated; fills result at the end.
+
+    Short texts stream the summary prompt while keywords are generated alongside;
+    long texts run the cached map/fold steps first and stream only the final reduce.
+    """
+    keywords_task = None
+    cache_key = cached = None
+    if SUMMARY_STRATEGY == "mapreduce" and len(text) > ANALYSIS_EXCERPT_CHARS:
+        yield "progress", {"stage": "map-reduce"}
+        final_input, keywords = await map_and_fold(db, text)
+        prompt = REDUCE_PROMPT.format(text=final_input, sentences="3-4")
+        cache_key = chunk_cache_key("final", final_input)
+        cached = (await load_cached_chunks(db, [cache_key])).get(cache_key)
+    else:
+        excerpt = text[:ANALYSIS_EXCERPT_CHARS]
+        prompt = SUMMARY_PROMPT.format(text=excerpt)
+        keywords_task = asyncio.create_task(ollama.generate(KEYWORDS_PROMPT.format(text=excerpt)))
+    await release_connection(db)
+    try:
+        if cached:
+            summary = cached["summary"]
+            yield "summary", {"token": summary}
+        else:
+            parts = []
+            async for token in ollama.generate_stream(prompt):
+                parts.append(token)
+                yield "summary", {"token": token}
+            summary = "".join(parts).strip()
+            if cache_key:
+                await store_cached_chunks({cache_key: {"summary": summary, "keywords": ""}})
+        if keywords_task:
+            keywords = (await keywords_task).get("response", "").strip()
+        yield "keywords", {"keywords": keywords}
+    finally:
+        if keywords_task and not keywords_task.done():
+            keywords_task.cancel()
+    result.update(summary=summary, keywords=keywords)
+
+async def handle_analyze_job(payload: dict) -> dict:
+    async with db_session() as db:
+        doc = (await db.execute(select(Document).where(Document.id == payload["document_id"]))).scalars().first()
+        if doc is None or not doc.file_path:
+            raise PermanentJobError("Document or file not found")
+        result = await run_document_analysis(db, doc)
+    if result["summary"] == ANALYSIS_FAILED:
+        raise RuntimeError("Ollama analysis failed")
+    return result
+
+JOB_HANDLERS["analyze_document"] = handle_analyze_job
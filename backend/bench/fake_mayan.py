@@ -0,0 +1,109 @@
+"""Local stand-in for the Mayan EDMS document upload API used by the benchmark suite.
+
+Serves POST /api/v4/documents/upload/ (token auth, multipart) and
+GET /api/v4/documents/<id>/ with a fixed per-upload latency. fail_rate makes
+that share of uploads answer 503 with Retry-After, to exercise retries and
+backpressure. `python bench/fake_mayan.py --port 8000` runs it on its own.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(latency: float, fail_rate: float, token: str, stats: dict):
+    lock = threading.Lock()
+    documents = {}
+    rng = random.Random(0)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status: int, obj, headers=None):
+            body = json.dumps(obj).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def authorized(self) -> bool:
+            if self.headers.get("Authorization") == f"Token {token}":
+                return True
+            self.send_json(401, {"detail": "Authentication credentials were not provided."})
+            return False
+
+        def do_GET(self):
+            if not self.authorized():
+                return
+            match = re.fullmatch(r"/api/v4/documents/(\d+)/", self.path)
+            document = documents.get(int(match.group(1))) if match else None
+            if document is None:
+                return self.send_json(404, {"detail": "Not found."})
+            self.send_json(200, document)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            if not self.authorized():
+                return
+            if self.path != "/api/v4/documents/upload/":
+                return self.send_json(404, {"detail": "Not found."})
+            with lock:
+                stats["in_flight"] = stats.get("in_flight", 0) + 1
+                stats["max_in_flight"] = max(stats.get("max_in_flight", 0), stats["in_flight"])
+                fail = rng.random() < fail_rate
+            try:
+                time.sleep(latency)
+                if fail:
+                    with lock:
+                        stats["rejected"] = stats.get("rejected", 0) + 1
+                    return self.send_json(503, {"detail": "Service unavailable"}, {"Retry-After": "1"})
+                label = re.search(rb'name="label"\r\n\r\n([^\r]*)', body)
+                with lock:
+                    document_id = len(documents) + 1
+                    documents[document_id] = {
+                        "id": document_id,
+                        "label": label.group(1).decode("utf-8", "replace") if label else "",
+                        "size": len(body),
+                    }
+                    stats["uploads"] = stats.get("uploads", 0) + 1
+                    stats["bytes"] = stats.get("bytes", 0) + len(body)
+                self.send_json(202, documents[document_id])
+            finally:
+                with lock:
+                    stats["in_flight"] -= 1
+
+    return Handler
+
+
+def start(port: int = 0, latency: float = 0.05, fail_rate: float = 0.0, token: str = "bench-token"):
+    """Serve in a daemon thread; returns (server, stats) with upload counts and the peak uploads in flight."""
+    stats = {}
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency, fail_rate, token, stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per upload")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of uploads answered with 503")
+    parser.add_argument("--token", default="bench-token")
+    args = parser.parse_args()
+    server, _ = start(args.port, args.latency, args.fail_rate, args.token)
+    print(f"Fake Mayan listening on 127.0.0.1:{server.server_address[1]} (token {args.token})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,108 @@
+"""Local stand-in for the Ollama HTTP API used by the benchmark suite.
+
+Serves /api/tags, /api/pull, /api/generate (streaming, non-streaming and
+format=json) and /api/embeddings with a fixed per-call latency so runs are
+reproducible without a GPU. `python bench/fake_ollama.py --port 11434` runs it
+on its own.
+"""
+import argparse
+import hashlib
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIM = 64
+
+
+def fake_embedding(text: str):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    values = [(digest[i % len(digest)] - 127.5) / 127.5 + math.sin(i) for i in range(EMBEDDING_DIM)]
+    return values
+
+
+def make_handler(latency: float, stats: dict):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, obj):
+            body = json.dumps(obj).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                return self.send_json({"models": [{"name": "mistral:latest"}, {"name": "nomic-embed-text:latest"}]})
+            self.send_error(404)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            stats[self.path] = stats.get(self.path, 0) + 1
+            if self.path == "/api/pull":
+                return self.send_json({"status": "success"})
+            if self.path == "/api/embeddings":
+                time.sleep(latency / 4)
+                return self.send_json({"embedding": fake_embedding(body.get("prompt", ""))})
+            if self.path != "/api/generate":
+                return self.send_error(404)
+
+            time.sleep(latency)
+            prompt = body.get("prompt", "")
+            words = prompt.split()[-40:]
+            if body.get("format") == "json":
+                response = json.dumps({"summary": "Résumé: " + " ".join(words[:25]), "keywords": words[:8]})
+            elif prompt.startswith("Extract"):
+                response = ", ".join(words[:8])
+            else:
+                response = "Résumé: " + " ".join(words[:25])
+            prompt_tokens, completion_tokens = len(prompt.split()), len(response.split())
+
+            if body.get("stream", True) is False:
+                return self.send_json({"response": response, "done": True,
+                                       "prompt_eval_count": prompt_tokens, "eval_count": completion_tokens})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for word in response.split(" "):
+                self.write_chunk({"response": word + " ", "done": False})
+            self.write_chunk({"response": "", "done": True,
+                              "prompt_eval_count": prompt_tokens, "eval_count": completion_tokens})
+            self.wfile.write(b"0\r\n\r\n")
+
+        def write_chunk(self, obj):
+            line = (json.dumps(obj) + "\n").encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+
+    return Handler
+
+
+def start(port: int = 0, latency: float = 0.02):
+    """Serve in a daemon thread; returns (server, stats) where stats counts calls per path."""
+    stats = {}
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency, stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per generate call")
+    args = parser.parse_args()
+    server, _ = start(args.port, args.latency)
+    print(f"Fake Ollama listening on 127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,570 @@
+"""Benchmark suite: runs app:app against a local database and fake Ollama and Mayan servers, then drives load scenarios.
+
+    python bench/run.py --db sqlite
+    python bench/run.py --db postgres --pg-url postgresql://postgres@localhost/postgres --db-mode async
+    python bench/run.py --db sqlite --scenarios login_burst,check_access --quick
+    python bench/run.py --db sqlite --update-baseline
+
+Every scenario reports throughput, p50/p99 latency and the peak RSS of the
+server (including its worker processes). Results are compared with
+bench/baselines/<db>-<mode>.json: a scenario whose throughput drops, or whose
+p99 or peak RSS grows, by more than --tolerance fails the run (exit code 1).
+Baselines are machine-specific; record your own with --update-baseline.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import sqlalchemy as sa
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import fake_mayan  # noqa: E402
+import fake_ollama  # noqa: E402
+
+USER_COUNT = 20
+PASSWORD = "bench-password"
+
+
+# ---------- process and measurement helpers ----------
+class RssSampler:
+    """Samples the summed RSS of a process tree every interval seconds and keeps the peak (Linux /proc)."""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def tree(pid: int):
+        pids, stack = [], [pid]
+        while stack:
+            current = stack.pop()
+            pids.append(current)
+            try:
+                for task in os.listdir(f"/proc/{current}/task"):
+                    with open(f"/proc/{current}/task/{task}/children") as f:
+                        stack.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+        return pids
+
+    def sample(self) -> int:
+        total = 0
+        for pid in self.tree(self.pid):
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            total += int(line.split()[1]) * 1024
+                            break
+            except OSError:
+                pass
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = self.sample()
+            self.peak = rss if self.peak is None else max(self.peak, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        if os.path.exists(f"/proc/{self.pid}/status"):
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    @property
+    def peak_mb(self):
+        return round(self.peak / 2**20, 1) if self.peak else None
+
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p * len(sorted_values)) - 1)]
+
+
+async def drive(request, total: int, concurrency: int) -> dict:
+    """Run request(i) for i in range(total) with at most concurrency in flight."""
+    latencies, errors = [], []
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await request(i)
+                if response.status_code >= 400:
+                    errors.append(f"{response.status_code} {response.text[:200]}")
+            except Exception as e:
+                errors.append(repr(e))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "elapsed_s": round(elapsed, 3),
+        "throughput": round(total / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+# ---------- environment ----------
+class Environment:
+    def __init__(self, args):
+        self.args = args
+        self.tmp = tempfile.mkdtemp(prefix="coffre-bench-")
+        self.ollama, self.ollama_stats = fake_ollama.start(latency=args.ollama_latency)
+        self.mayan, self.mayan_stats = fake_mayan.start(latency=args.mayan_latency)
+        self.pg_admin_url = None
+        self.database_url = self.create_database()
+        self.base_url = f"http://127.0.0.1:{args.port}"
+        self.server = None
+        self.admin_token = None
+        self.user_tokens = []
+        self.user_ids = []
+
+    def create_database(self) -> str:
+        if self.args.db == "sqlite":
+            return f"sqlite:///{self.tmp}/bench.db"
+        url = sa.engine.make_url(self.args.pg_url)
+        self.pg_admin_url = url
+        self.pg_name = f"coffre_bench_{os.getpid()}"
+        admin = sa.create_engine(url, isolation_level="AUTOCOMMIT")
+        with admin.connect() as conn:
+            conn.execute(sa.text(f'DROP DATABASE IF EXISTS "{self.pg_name}"'))
+            conn.execute(sa.text(f'CREATE DATABASE "{self.pg_name}"'))
+        admin.dispose()
+        return url.set(database=self.pg_name).render_as_string(hide_password=False)
+
+    def start_server(self):
+        env = dict(
+            os.environ,
+            DATABASE_URL=self.database_url,
+            DB_MODE=self.args.db_mode,
+            UPLOAD_DIR=os.path.join(self.tmp, "uploads"),
+            VECTOR_INDEX_DIR=os.path.join(self.tmp, "vectors"),
+            OLLAMA_API_URL=f"http://127.0.0.1:{self.ollama.server_address[1]}",
+            SECRET_KEY="bench-secret",
+            JOB_QUEUE_BACKEND="memory",
+            MAYAN_API_URL=f"http://127.0.0.1:{self.mayan.server_address[1]}",
+            MAYAN_API_TOKEN="bench-token",
+            # only the mayan_sync scenario pushes, through the backfill endpoint
+            MAYAN_SYNC_ON_UPLOAD="false",
+            # measure queueing under the login burst instead of the fail-fast 503s
+            HASH_QUEUE_LIMIT="256",
+        )
+        self.server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+             "--port", str(self.args.port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env,
+        )
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            if self.server.poll() is not None:
+                raise SystemExit(f"Server exited with code {self.server.returncode}")
+            try:
+                if httpx.get(self.base_url + "/", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        raise SystemExit("Server did not start within 60s")
+
+    def stop(self):
+        if self.server and self.server.poll() is None:
+            self.server.send_signal(signal.SIGINT)
+            try:
+                self.server.wait(15)
+            except subprocess.TimeoutExpired:
+                self.server.kill()
+        self.ollama.shutdown()
+        self.mayan.shutdown()
+        if self.pg_admin_url is not None:
+            admin = sa.create_engine(self.pg_admin_url, isolation_level="AUTOCOMMIT")
+            with admin.connect() as conn:
+                conn.execute(sa.text(f'DROP DATABASE IF EXISTS "{self.pg_name}"'))
+            admin.dispose()
+        if not self.args.keep:
+            shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def client(self, token=None, timeout=120) -> httpx.AsyncClient:
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        limits = httpx.Limits(max_connections=200, max_keepalive_connections=200)
+        return httpx.AsyncClient(base_url=self.base_url, headers=headers, timeout=timeout, limits=limits)
+
+    async def seed(self):
+        """Admin + USER_COUNT users through the API, then documents straight into the database."""
+        async with self.client() as client:
+            async def register(email):
+                r = await client.post("/auth/register", data={"email": email, "password": PASSWORD, "full_name": email})
+                r.raise_for_status()
+                return r.json()
+
+            await register("admin@bench.local")
+            users = await asyncio.gather(*(register(f"user{i}@bench.local") for i in range(USER_COUNT)))
+            self.user_tokens = [u["access_token"] for u in users]
+            self.user_ids = [u["user_id"] for u in users]
+
+            engine = sa.create_engine(self.database_url)
+            with engine.begin() as conn:
+                conn.execute(sa.text("UPDATE users SET role = 'admin' WHERE email = 'admin@bench.local'"))
+            r = await client.post("/auth/login", data={"email": "admin@bench.local", "password": PASSWORD, "role": "admin"})
+            r.raise_for_status()
+            self.admin_token = r.json()["access_token"]
+
+        started = time.perf_counter()
+        base = datetime.utcnow() - timedelta(days=365)
+        insert = sa.text(
+            "INSERT INTO documents (mayan_id, mayan_status, title, description, uploaded_by, file_path, created_at) "
+            "VALUES (:mayan_id, 'synced', :title, :description, :uploaded_by, :file_path, :created_at)"
+        )
+        with engine.begin() as conn:
+            for offset in range(0, self.args.rows, 5000):
+                conn.execute(insert, [
+                    {
+                        "mayan_id": f"bench_{i}",
+                        "title": f"Document {i}",
+                        "description": f"Description du document numéro {i}",
+                        "uploaded_by": self.user_ids[i % USER_COUNT],
+                        "file_path": f"bench/{i}.pdf",
+                        "created_at": base + timedelta(seconds=i * 60),
+                    }
+                    for i in range(offset, min(offset + 5000, self.args.rows))
+                ])
+            if self.args.db == "postgres":
+                conn.execute(sa.text("ANALYZE documents"))
+        engine.dispose()
+        print(f"Seeded {self.args.rows} documents in {time.perf_counter() - started:.1f}s")
+
+
+# ---------- scenarios ----------
+async def login_burst(env: Environment, quick: bool) -> dict:
+    async with env.client() as client:
+        async def request(i):
+            return await client.post("/auth/login", data={
+                "email": f"user{i % USER_COUNT}@bench.local", "password": PASSWORD, "role": "user",
+            })
+        return await drive(request, 100 if quick else 400, 32)
+
+
+async def check_access(env: Environment, quick: bool) -> dict:
+    async with env.client(env.admin_token) as admin:
+        r = await admin.post("/access-windows/bulk", json={
+            "user_ids": env.user_ids, "windows": [{"start_time": "00:00", "end_time": "23:59"}],
+        })
+        r.raise_for_status()
+    clients = [env.client(token) for token in env.user_tokens]
+    try:
+        async def request(i):
+            return await clients[i % len(clients)].get("/check-access")
+        return await drive(request, 1000 if quick else 5000, 32)
+    finally:
+        await asyncio.gather(*(c.aclose() for c in clients))
+
+
+async def documents_paginated(env: Environment, quick: bool) -> dict:
+    async with env.client(env.admin_token) as client:
+        cursors, cursor = [None], None
+        for _ in range(50):
+            r = await client.get("/documents", params={"limit": 50, **({"cursor": cursor} if cursor else {})})
+            cursor = r.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+            cursors.append(cursor)
+
+        async def request(i):
+            params = {"limit": 50}
+            if cursors[i % len(cursors)]:
+                params["cursor"] = cursors[i % len(cursors)]
+            return await client.get("/documents", params=params)
+        return await drive(request, 300 if quick else 1000, 16)
+
+
+async def documents_full_scan(env: Environment, quick: bool) -> dict:
+    """Every row through the listing API (what the old unpaginated GET /documents returned)."""
+    async with env.client(env.admin_token) as client:
+        latencies, rows, pages, cursor = [], 0, 0, None
+        started = time.perf_counter()
+        while True:
+            params = {"limit": 500, "include_total": "false"}
+            if cursor:
+                params["cursor"] = cursor
+            t = time.perf_counter()
+            r = await client.get("/documents", params=params)
+            latencies.append(time.perf_counter() - t)
+            r.raise_for_status()
+            rows += len(r.json())
+            pages += 1
+            cursor = r.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": pages,
+        "errors": 0 if rows == env.args.rows else 1,
+        "first_error": None if rows == env.args.rows else f"saw {rows} of {env.args.rows} rows",
+        "elapsed_s": round(elapsed, 3),
+        "throughput": round(rows / elapsed, 2),
+        "unit": "rows/s",
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+async def large_uploads(env: Environment, quick: bool) -> dict:
+    size = (5 if quick else 20) * 2**20
+    count = 8 if quick else 16
+    seed = os.urandom(size)
+    async with env.client(env.user_tokens[0], timeout=600) as client:
+        async def request(i):
+            # distinct content per upload so deduplication does not short-circuit the write
+            body = i.to_bytes(8, "big") + seed[8:]
+            return await client.post("/documents/upload", data={"title": f"upload {i}"},
+                                     files={"file": (f"upload{i}.bin", body, "application/octet-stream")})
+        result = await drive(request, count, 4)
+    result["unit"] = "uploads/s"
+    result["mb_per_s"] = round(count * size / 2**20 / result["elapsed_s"], 1)
+    return result
+
+
+def make_pdf(path: str, pages: int, seed: int):
+    import fitz  # PyMuPDF
+    rng = random.Random(seed)
+    words = ["archive", "numérique", "village", "résilient", "document", "stratégie", "réseau", "citoyen",
+             "énergie", "données", "sécurité", "local", "budget", "projet", "commune", "service"]
+    doc = fitz.open()
+    for page_no in range(pages):
+        page = doc.new_page()
+        text = f"Page {page_no} ({seed})\n" + "\n".join(
+            " ".join(rng.choice(words) for _ in range(12)) for _ in range(40)
+        )
+        page.insert_text((40, 40), text, fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+def make_docx(path: str, paragraphs: int, seed: int):
+    import docx
+    rng = random.Random(seed)
+    words = ["rapport", "annuel", "commune", "habitants", "infrastructure", "numérique", "formation",
+             "atelier", "bibliothèque", "connexion", "solidarité", "partage"]
+    document = docx.Document()
+    for i in range(paragraphs):
+        document.add_paragraph(f"{i} ({seed}) " + " ".join(rng.choice(words) for _ in range(20)))
+    document.save(path)
+
+
+async def analyze_file(env: Environment, quick: bool) -> dict:
+    per_type = 2 if quick else 4
+    fixtures = os.path.join(env.tmp, "fixtures")
+    os.makedirs(fixtures, exist_ok=True)
+    doc_ids = []
+    async with env.client(env.user_tokens[1], timeout=600) as client:
+        for i in range(per_type):
+            for ext, build, amount in ((".pdf", make_pdf, 60), (".docx", make_docx, 1500)):
+                path = os.path.join(fixtures, f"large{i}{ext}")
+                build(path, amount, seed=i * 7919 + len(ext))
+                with open(path, "rb") as f:
+                    r = await client.post("/documents/upload", data={"title": f"large {i}{ext}"},
+                                          files={"file": (os.path.basename(path), f.read())})
+                r.raise_for_status()
+                doc_ids.append(r.json()["id"])
+
+        async def request(i):
+            return await client.post(f"/documents/analyze-file/{doc_ids[i]}", params={"sync": "true"})
+        result = await drive(request, len(doc_ids), 4)
+    result["unit"] = "docs/s"
+    return result
+
+
+async def mayan_sync(env: Environment, quick: bool) -> dict:
+    """Backfill push of freshly uploaded files to the fake Mayan, until none is pending."""
+    count = 50 if quick else 200
+    user_id, token = env.user_ids[2], env.user_tokens[2]
+    async with env.client(token, timeout=600) as client:
+        files = [("files", (f"mayan{i}.txt", os.urandom(32 * 1024), "text/plain")) for i in range(count)]
+        r = await client.post("/documents/bulk-upload", files=files)
+        r.raise_for_status()
+        async with env.client(env.admin_token) as admin:
+            started = time.perf_counter()
+            r = await admin.post("/mayan/sync", params={"uploaded_by": user_id})
+            r.raise_for_status()
+            while True:
+                counts = (await client.get("/mayan/sync-status")).json()["counts"]
+                if counts["pending"] == 0 and counts["syncing"] == 0:
+                    break
+                await asyncio.sleep(0.05)
+            elapsed = time.perf_counter() - started
+            stats = (await admin.get("/mayan/sync-status")).json()["client"]
+    return {
+        "requests": count,
+        "errors": counts["failed"],
+        "first_error": f"{counts['failed']} documents failed to sync" if counts["failed"] else None,
+        "elapsed_s": round(elapsed, 3),
+        "throughput": round(count / elapsed, 2),
+        "unit": "docs/s",
+        "p50_ms": round(stats["latency_p50"] * 1000, 2),
+        "p99_ms": round(stats["latency_p99"] * 1000, 2),
+        "max_in_flight": env.mayan_stats.get("max_in_flight"),
+    }
+
+
+SCENARIOS = {
+    "login_burst": login_burst,
+    "check_access": check_access,
+    "documents_paginated": documents_paginated,
+    "documents_full_scan": documents_full_scan,
+    "large_uploads": large_uploads,
+    "analyze_file": analyze_file,
+    "mayan_sync": mayan_sync,
+}
+
+
+# ---------- baselines ----------
+def compare(results: dict, baseline: dict, tolerance: float):
+    """Regression messages for every scenario present in both runs."""
+    failures = []
+    for name, current in results.items():
+        if current["errors"]:
+            failures.append(f"{name}: {current['errors']} errors ({current['first_error']})")
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base.get("throughput") and current["throughput"] < base["throughput"] * (1 - tolerance):
+            failures.append(f"{name}: throughput {current['throughput']} < baseline {base['throughput']}")
+        if base.get("p99_ms") and current["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            failures.append(f"{name}: p99 {current['p99_ms']}ms > baseline {base['p99_ms']}ms")
+        if base.get("peak_rss_mb") and current.get("peak_rss_mb") and current["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            failures.append(f"{name}: peak RSS {current['peak_rss_mb']}MB > baseline {base['peak_rss_mb']}MB")
+    return failures
+
+
+def print_table(results: dict):
+    print(f"\n{'scenario':22s} {'throughput':>16s} {'p50 ms':>9s} {'p99 ms':>9s} {'peak RSS':>10s} {'errors':>7s}")
+    for name, r in results.items():
+        throughput = f"{r['throughput']} {r.get('unit', 'req/s')}"
+        rss = f"{r['peak_rss_mb']}MB" if r.get("peak_rss_mb") else "-"
+        print(f"{name:22s} {throughput:>16s} {r['p50_ms']:>9} {r['p99_ms']:>9} {rss:>10s} {r['errors']:>7}")
+
+
+async def run(args) -> int:
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}")
+
+    env = Environment(args)
+    results = {}
+    try:
+        env.start_server()
+        await env.seed()
+        for name in names:
+            print(f"Running {name}...")
+            with RssSampler(env.server.pid) as rss:
+                result = await SCENARIOS[name](env, args.quick)
+            result["peak_rss_mb"] = rss.peak_mb
+            results[name] = result
+    finally:
+        env.stop()
+
+    print_table(results)
+    report = {
+        "meta": {
+            "db": args.db,
+            "db_mode": args.db_mode,
+            "rows": args.rows,
+            "quick": args.quick,
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+            "ollama_latency_s": args.ollama_latency,
+            "mayan_latency_s": args.mayan_latency,
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        },
+        "scenarios": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    baseline_path = args.baseline or os.path.join(BENCH_DIR, "baselines", f"{args.db}-{args.db_mode}.json")
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                previous = json.load(f)
+            # keep scenarios that were not part of this run
+            report["scenarios"] = {**previous.get("scenarios", {}), **results}
+        with open(baseline_path, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {baseline_path}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}; run with --update-baseline to record one")
+        failures = compare(results, {}, args.tolerance)
+    else:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("rows") != args.rows or baseline["meta"].get("quick") != args.quick:
+            print("Warning: baseline was recorded with different --rows/--quick settings")
+        failures = compare(results, baseline["scenarios"], args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    print("FAILED" if failures else "OK")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CoffreFort backend benchmark suite")
+    parser.add_argument("--db", choices=["sqlite", "postgres"], default="sqlite")
+    parser.add_argument("--db-mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--pg-url", default=os.getenv("BENCH_PG_URL", "postgresql://postgres@localhost/postgres"),
+                        help="admin connection used to create and drop a throwaway database")
+    parser.add_argument("--rows", type=int, default=100_000, help="documents seeded for the listing scenarios")
+    parser.add_argument("--scenarios", help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--quick", action="store_true", help="smaller request counts and files")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--ollama-latency", type=float, default=0.02, help="seconds per fake generate call")
+    parser.add_argument("--mayan-latency", type=float, default=0.05, help="seconds per fake Mayan upload")
+    parser.add_argument("--baseline", help="baseline file (default bench/baselines/<db>-<mode>.json)")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed relative regression")
+    parser.add_argument("--output", help="write this run's results as JSON")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary upload directory")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Content-addressed file store under UPLOAD_DIR/blobs.
+
+One file per SHA-256, shared and reference counted by the documents that point at it.
+"""
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import select, delete, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Optional, Tuple
+import os
+import hashlib
+import zipfile
+import aiofiles
+
+from config import MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE, UPLOAD_DIR
+from database import DB_DIALECT
+from models import Blob, Document
+
+def file_url(document_id: int, file_path: Optional[str]) -> Optional[str]:
+    """Link handed to clients: the permission-checked download route, never the stored path."""
+    return f"/documents/{document_id}/download" if file_path else None
+
+def blob_relpath(sha256: str, ext: str) -> str:
+    # two levels of 256-way sharding keep directories small
+    return os.path.join("blobs", sha256[:2], sha256[2:4], f"{sha256}{ext.lower()}")
+
+def dialect_insert(model):
+    """INSERT construct of the active dialect, for ON CONFLICT upserts (Postgres and SQLite)."""
+    if DB_DIALECT == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+async def acquire_blob(db: AsyncSession, tmp_path: str, sha256: str, size: int, ext: str) -> Tuple[str, bool]:
+    """Add a reference to the blob for sha256; call place_blob(tmp_path, file_path) once committed.
+
+    A single upsert takes the reference, so concurrent uploads of the same content
+    never fail and never roll back the caller's transaction (bulk uploads batch many
+    blobs per transaction). Returns (file_path relative to UPLOAD_DIR, whether the
+    content already existed).
+    """
+    rel_path = blob_relpath(sha256, ext)
+    stmt = dialect_insert(Blob).values(
+        sha256=sha256, file_path=rel_path, file_size=size, ref_count=1, created_at=datetime.utcnow()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Blob.sha256], set_={"ref_count": Blob.ref_count + 1}
+    ).returning(Blob.file_path, Blob.ref_count)
+    file_path, ref_count = (await db.execute(stmt)).one()
+    return file_path, ref_count > 1
+
+def place_blob(tmp_path: str, file_path: str):
+    """Move a committed upload into the store, or drop it when the content is already there.
+
+    Only called after commit, so a rolled-back insert never leaves a file in the
+    store. A reference taken before the first uploader placed the file (or after
+    it died without doing so) finds nothing and places its own identical copy.
+    """
+    dest_path = os.path.join(UPLOAD_DIR, file_path)
+    if os.path.exists(dest_path):
+        os.remove(tmp_path)
+        return
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    os.replace(tmp_path, dest_path)
+
+async def release_blob(db: AsyncSession, doc: "Document") -> Optional[str]:
+    """Drop doc's reference to its file.
+
+    Blob files are removed by reap_blob() after the caller commits; for files stored
+    before the blob store existed, returns the absolute path to unlink once no row uses it.
+    """
+    if not doc.file_path:
+        return None
+    if doc.sha256:
+        result = await db.execute(
+            update(Blob).where(Blob.sha256 == doc.sha256).values(ref_count=Blob.ref_count - 1)
+        )
+        if result.rowcount:
+            return None
+    # files stored before the blob store existed are owned by their path
+    others = (await db.execute(
+        select(func.count()).select_from(Document)
+        .where(Document.file_path == doc.file_path, Document.id != doc.id)
+    )).scalar_one()
+    return None if others else os.path.join(UPLOAD_DIR, doc.file_path)
+
+async def reap_blob(db: AsyncSession, sha256: str) -> bool:
+    """Delete the blob row and its file if no document references it any more; True if removed.
+
+    Runs in its own transaction after the release is committed. The row lock (FOR
+    UPDATE, and the DELETE itself on SQLite) makes a concurrent acquire_blob of the
+    same content wait, so its upsert either revives the row first (ref_count > 0,
+    nothing is removed) or inserts a fresh one after the file is gone and places it again.
+    """
+    blob = (await db.execute(select(Blob.file_path).where(Blob.sha256 == sha256).with_for_update())).first()
+    if blob is None:
+        await db.rollback()
+        return False
+    removed = await db.execute(delete(Blob).where(Blob.sha256 == sha256, Blob.ref_count <= 0))
+    if not removed.rowcount:
+        await db.rollback()
+        return False
+    path = os.path.join(UPLOAD_DIR, blob.file_path)
+    if os.path.exists(path):
+        os.remove(path)
+    await db.commit()
+    return True
+
+async def stream_upload_to_disk(file: UploadFile, dest_path: str) -> Tuple[int, str]:
+    """Copy an upload to dest_path in UPLOAD_CHUNK_SIZE pieces; returns (size, sha256 hex).
+
+    Aborts with 413 as soon as MAX_UPLOAD_SIZE is exceeded and never leaves a
+    partial file behind.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = dest_path + ".part"
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise HTTPException(status_code=413, detail=f"File too large (max {MAX_UPLOAD_SIZE} bytes)")
+                digest.update(chunk)
+                await out.write(chunk)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size, digest.hexdigest()
+
+def copy_stream_to_disk(src, dest_path: str) -> Tuple[int, str]:
+    """Blocking counterpart of stream_upload_to_disk for file objects such as ZIP members."""
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = dest_path + ".part"
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise ValueError(f"File too large (max {MAX_UPLOAD_SIZE} bytes)")
+                digest.update(chunk)
+                out.write(chunk)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size, digest.hexdigest()
+
+def copy_zip_member(archive: zipfile.ZipFile, member: zipfile.ZipInfo, dest_path: str) -> Tuple[int, str]:
+    with archive.open(member) as src:
+        return copy_stream_to_disk(src, dest_path)
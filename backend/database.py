@@ -0,0 +1,153 @@
+"""Engines and sessions for both DB_MODEs, created lazily on first use."""
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker, Session
+from contextlib import asynccontextmanager
+import os
+from prometheus_client import REGISTRY
+
+from config import DATABASE_URL, DB_MAX_OVERFLOW, DB_MODE, DB_POOL_PRE_PING, DB_POOL_SIZE, METRICS_ENABLED
+from metrics import PoolCollector, instrument_engine
+
+def to_async_url(url: str) -> str:
+    if url.startswith("postgresql://") or url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+def engine_options(url: str) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    # sqlite (local runs) has its own pool classes without size/overflow
+    if not url.startswith("sqlite"):
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    return options
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+DB_DIALECT = make_url(DATABASE_URL).get_backend_name()
+
+# created on first use: importing the module neither loads a driver nor connects,
+# so it can be preloaded by a forking server before the workers start
+engine = None
+SessionLocal = None
+async_engine = None
+AsyncSessionLocal = None
+
+def get_engine():
+    global engine, SessionLocal
+    if engine is None:
+        engine = create_engine(DATABASE_URL, future=True, **engine_options(DATABASE_URL))
+        # like AsyncSessionLocal: a commit leaves loaded objects readable, so code that commits
+        # to release its connection before a slow await does not lazily check one out again
+        SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+        if METRICS_ENABLED:
+            instrument_engine(engine)
+    return engine
+
+def get_async_engine():
+    global async_engine, AsyncSessionLocal
+    if async_engine is None:
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+        if METRICS_ENABLED:
+            instrument_engine(async_engine.sync_engine)
+    return async_engine
+
+def active_engines():
+    engines = [("sync", engine)] if engine is not None else []
+    if async_engine is not None:
+        engines.append(("async", async_engine.sync_engine))
+    return engines
+
+if METRICS_ENABLED:
+    REGISTRY.register(PoolCollector(active_engines))
+
+Base = declarative_base()
+
+class SyncSessionShim:
+    """AsyncSession-compatible wrapper around a blocking Session (DB_MODE=sync).
+
+    Calls run inline on the event loop exactly like the original handlers did,
+    so both modes share the same route code and can be benchmarked side by side.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    async def execute(self, statement, *args, **kwargs):
+        return self.session.execute(statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        return self.session.scalar(statement, *args, **kwargs)
+
+    async def get(self, entity, ident):
+        return self.session.get(entity, ident)
+
+    def add(self, instance):
+        self.session.add(instance)
+
+    def add_all(self, instances):
+        self.session.add_all(instances)
+
+    async def delete(self, instance):
+        self.session.delete(instance)
+
+    def expunge(self, instance):
+        self.session.expunge(instance)
+
+    async def flush(self):
+        self.session.flush()
+
+    async def commit(self):
+        self.session.commit()
+
+    async def rollback(self):
+        self.session.rollback()
+
+    async def refresh(self, instance):
+        self.session.refresh(instance)
+
+    async def close(self):
+        self.session.close()
+
+@asynccontextmanager
+async def db_session():
+    """Session for code running outside a request (jobs, workers)."""
+    if DB_MODE == "async":
+        get_async_engine()
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+    get_engine()
+    db = SessionLocal()
+    try:
+        yield SyncSessionShim(db)
+    finally:
+        db.close()
+
+async def get_db():
+    async with db_session() as db:
+        yield db
+
+async def release_connection(db: AsyncSession):
+    """Hand db's pooled connection back before a slow await (extraction, Ollama).
+
+    Ends the current transaction; nothing is expired, so objects already loaded stay
+    readable and the next query simply checks a connection out again. In DB_MODE=sync
+    a checkout held across such an await lets a few slow requests exhaust the pool and
+    block the event loop in the pool timeout.
+    """
+    await db.commit()
+
+def pool_capacity() -> int:
+    """Connections one process can check out at once."""
+    return DB_POOL_SIZE + DB_MAX_OVERFLOW
+
+async def dispose_engines():
+    if async_engine is not None:
+        await async_engine.dispose()
+    if engine is not None:
+        engine.dispose()
@@ -0,0 +1,142 @@
+"""Text extraction (PDF, DOCX, plain text) in a process pool, persisted once per blob."""
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import os
+import asyncio
+import time
+
+from config import EXTRACT_POOL_WORKERS, EXTRACT_TIMEOUT, UPLOAD_DIR
+from metrics import ERRORS, EXTRACT_LATENCY, EXTRACT_PAGES, file_type_label, record_stage
+from database import release_connection
+from models import Blob, Document, refresh_search_vectors
+
+# helper: extract text from uploaded file
+def extract_text_sync(file_path: str, max_chars: Optional[int] = None, max_pages: Optional[int] = None) -> Tuple[str, int]:
+    """Parse a file and return (text, pages read); stops early once max_chars/max_pages is reached.
+
+    Runs inside the extraction process pool.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    # PDF
+    if ext == ".pdf":
+        try:
+            import fitz  # PyMuPDF
+            text_parts, length, pages = [], 0, 0
+            with fitz.open(file_path) as doc:
+                for page in doc:
+                    if max_pages is not None and pages >= max_pages:
+                        break
+                    if max_chars is not None and length >= max_chars:
+                        break
+                    page_text = page.get_text()
+                    text_parts.append(page_text)
+                    length += len(page_text) + 1
+                    pages += 1
+            text = "\n".join(text_parts)
+        except Exception as e:
+            raise RuntimeError(f"PDF parsing failed: {e}")
+    # DOCX
+    elif ext == ".docx":
+        try:
+            import docx
+            text_parts, length = [], 0
+            for p in docx.Document(file_path).paragraphs:
+                if max_chars is not None and length >= max_chars:
+                    break
+                text_parts.append(p.text)
+                length += len(p.text) + 1
+            text, pages = "\n".join(text_parts), 0
+        except Exception as e:
+            raise RuntimeError(f"DOCX parsing failed: {e}")
+    # Plain text fallback
+    else:
+        try:
+            with open(file_path, "rb") as f:
+                # utf-8 needs at most 4 bytes per character
+                raw = f.read(max_chars * 4) if max_chars is not None else f.read()
+            text, pages = raw.decode("utf-8", errors="ignore"), 0
+        except Exception as e:
+            raise RuntimeError(f"File read failed: {e}")
+    if max_chars is not None:
+        text = text[:max_chars]
+    # Postgres text columns reject NUL characters
+    return text.replace("\x00", ""), pages
+
+_extract_executor: Optional[ProcessPoolExecutor] = None
+
+def get_extract_executor() -> ProcessPoolExecutor:
+    global _extract_executor
+    if _extract_executor is None:
+        _extract_executor = ProcessPoolExecutor(max_workers=EXTRACT_POOL_WORKERS)
+    return _extract_executor
+
+def reset_extract_executor():
+    """Kill the pool, e.g. after a timeout left a worker stuck on a pathological file."""
+    global _extract_executor
+    executor, _extract_executor = _extract_executor, None
+    if executor is not None:
+        for process in list(getattr(executor, "_processes", {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+async def extract_text_with_pages(file_path: str, max_chars: Optional[int] = None, max_pages: Optional[int] = None) -> Tuple[str, int]:
+    file_type = file_type_label(file_path)
+    started = time.perf_counter()
+    try:
+        text, pages = await run_extraction(file_path, max_chars, max_pages)
+    except Exception:
+        ERRORS.labels("extract").inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        EXTRACT_LATENCY.labels(file_type).observe(elapsed)
+        record_stage("extract", elapsed)
+    EXTRACT_PAGES.labels(file_type).inc(pages)
+    return text, pages
+
+async def run_extraction(file_path: str, max_chars: Optional[int], max_pages: Optional[int]) -> Tuple[str, int]:
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        future = loop.run_in_executor(get_extract_executor(), extract_text_sync, file_path, max_chars, max_pages)
+        try:
+            return await asyncio.wait_for(future, EXTRACT_TIMEOUT)
+        except asyncio.TimeoutError:
+            reset_extract_executor()
+            raise HTTPException(status_code=504, detail=f"Text extraction timed out after {EXTRACT_TIMEOUT:g}s")
+        except BrokenProcessPool:
+            # another call's timeout killed the pool under us; retry once on a fresh one
+            if attempt:
+                raise HTTPException(status_code=500, detail="Text extraction worker crashed")
+            reset_extract_executor()
+        except RuntimeError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+async def get_document_text(db: AsyncSession, doc: "Document", max_chars: Optional[int] = None) -> str:
+    """Text of doc's file, parsed at most once per content digest.
+
+    The text is persisted on the blob row. Callers needing only a prefix get an
+    early-stopped parse when nothing is stored yet; that prefix is stored too
+    (extracted_partial) and reused for requests it covers, until a full parse replaces it.
+    """
+    blob = await db.get(Blob, doc.sha256) if doc.sha256 else None
+    if blob is not None and blob.extracted_text is not None:
+        if not blob.extracted_partial or (max_chars is not None and len(blob.extracted_text) >= max_chars):
+            return blob.extracted_text if max_chars is None else blob.extracted_text[:max_chars]
+
+    file_path = os.path.join(UPLOAD_DIR, doc.file_path)
+    await release_connection(db)
+    text, pages = await extract_text_with_pages(file_path, max_chars=max_chars)
+    # a parse that stopped before max_chars reached the end of the file
+    partial = max_chars is not None and len(text) >= max_chars
+    if blob is not None:
+        blob.extracted_text = text
+        blob.extracted_partial = partial
+        if not partial:
+            blob.page_count = pages
+        await db.flush()
+        await refresh_search_vectors(db, Document.sha256 == blob.sha256)
+        await db.commit()
+    return text
@@ -0,0 +1,26 @@
+"""Multi-worker mode: `python migrate.py && gunicorn app:app -c gunicorn.conf.py`.
+
+The app is imported once in the master (preload) and forked into uvicorn
+workers. Importing it opens no database connection, thread or process pool,
+so nothing is shared across the fork; each worker creates its own on first use.
+Run with AUTO_MIGRATE=false so the workers do not race on schema creation, and
+JOB_QUEUE_BACKEND=redis so job state is shared between them.
+"""
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(4, (os.cpu_count() or 1) * 2))))
+# read by the app, which turns its per-process caches off when several workers cannot share invalidations
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def child_exit(server, worker):
+    # per-process metric files of dead workers (PROMETHEUS_MULTIPROC_DIR) must be cleaned up
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
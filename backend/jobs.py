@@ -0,0 +1,312 @@
+"""Durable background jobs: memory and Redis queues with leases and retries, and the workers.
+
+Modules register their job kinds in JOB_HANDLERS; worker.py runs the same loops out of process.
+"""
+from fastapi import HTTPException
+from datetime import datetime
+from typing import Optional
+import asyncio
+import json
+import uuid
+import time
+
+from config import (
+    JOB_LEASE_TIMEOUT, JOB_MAX_ATTEMPTS, JOB_QUEUE_BACKEND, JOB_QUEUE_RETRY_MAX, JOB_RESULT_TTL,
+    JOB_RETRY_BACKOFF, REDIS_URL,
+)
+from metrics import ERRORS, JOBS_PROCESSED
+
+JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED = "queued", "running", "succeeded", "failed"
+
+# kind -> async handler(payload) -> result; each subsystem registers the jobs it runs
+JOB_HANDLERS = {}
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when retrying cannot help."""
+
+def new_job(kind: str, payload: dict, dedupe_key: Optional[str], user_id: Optional[int]) -> dict:
+    now = datetime.utcnow().isoformat()
+    return {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "payload": payload,
+        "status": JOB_QUEUED,
+        "attempts": 0,
+        "max_attempts": JOB_MAX_ATTEMPTS,
+        "result": None,
+        "error": None,
+        "dedupe_key": dedupe_key,
+        "user_id": user_id,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+def job_view(job: dict) -> dict:
+    return {k: job[k] for k in ("id", "kind", "payload", "status", "attempts", "result", "error", "created_at", "updated_at")}
+
+def retry_delay(attempts: int) -> float:
+    return JOB_RETRY_BACKOFF * (2 ** max(attempts - 1, 0))
+
+class MemoryJobQueue:
+    """Single-process queue; jobs are lost on restart, so only meant for tests and local runs."""
+
+    def __init__(self):
+        self.jobs = {}
+        self.dedupe = {}
+        self._ready: Optional[asyncio.Queue] = None
+
+    @property
+    def ready(self) -> asyncio.Queue:
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+        return self._ready
+
+    async def enqueue(self, kind: str, payload: dict, dedupe_key: Optional[str] = None, user_id: Optional[int] = None) -> dict:
+        if dedupe_key:
+            existing = self.jobs.get(self.dedupe.get(dedupe_key))
+            if existing and existing["status"] in (JOB_QUEUED, JOB_RUNNING):
+                return existing
+        job = new_job(kind, payload, dedupe_key, user_id)
+        self.jobs[job["id"]] = job
+        if dedupe_key:
+            self.dedupe[dedupe_key] = job["id"]
+        self.ready.put_nowait(job["id"])
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return self.jobs.get(job_id)
+
+    async def reserve(self, timeout: float = 1.0) -> Optional[dict]:
+        try:
+            job_id = await asyncio.wait_for(self.ready.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        job = self.jobs[job_id]
+        job.update(status=JOB_RUNNING, attempts=job["attempts"] + 1, updated_at=datetime.utcnow().isoformat())
+        return job
+
+    async def complete(self, job: dict, result: dict):
+        job.update(status=JOB_SUCCEEDED, result=result, error=None, updated_at=datetime.utcnow().isoformat())
+
+    async def fail(self, job: dict, error: str, retry: bool = True):
+        job.update(error=error, updated_at=datetime.utcnow().isoformat())
+        if retry and job["attempts"] < job["max_attempts"]:
+            job["status"] = JOB_QUEUED
+            asyncio.get_running_loop().call_later(retry_delay(job["attempts"]), self.ready.put_nowait, job["id"])
+        else:
+            job["status"] = JOB_FAILED
+
+    async def keep_alive(self, job: dict):
+        pass
+
+    async def recover(self):
+        pass
+
+class RedisJobQueue:
+    """Durable queue on Redis (reliable-queue pattern: ready list -> processing list).
+
+    Every reserved job holds a lease (leases zset, scored by expiry) that its
+    worker renews while the handler runs. recover() puts back only jobs whose
+    lease lapsed, so it can run while other workers are busy; handlers must
+    still be idempotent, since a worker stalled past its lease loses the job.
+    """
+
+    prefix = "coffrefort:jobs"
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis_asyncio
+        self.redis = redis_asyncio.from_url(url, decode_responses=True)
+        self.ready_key = f"{self.prefix}:ready"
+        self.processing_key = f"{self.prefix}:processing"
+        self.delayed_key = f"{self.prefix}:delayed"
+        self.leases_key = f"{self.prefix}:leases"
+
+    def job_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    def dedupe_key(self, key: str) -> str:
+        return f"{self.prefix}:dedupe:{key}"
+
+    async def save(self, job: dict, ttl: Optional[int] = None):
+        key = self.job_key(job["id"])
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(key, json.dumps(job, default=str))
+            if ttl:
+                pipe.expire(key, ttl)
+            await pipe.execute()
+
+    async def enqueue(self, kind: str, payload: dict, dedupe_key: Optional[str] = None, user_id: Optional[int] = None) -> dict:
+        job = new_job(kind, payload, dedupe_key, user_id)
+        if dedupe_key:
+            rkey = self.dedupe_key(dedupe_key)
+            if not await self.redis.set(rkey, job["id"], nx=True, ex=JOB_RESULT_TTL):
+                existing = await self.get(await self.redis.get(rkey) or "")
+                if existing and existing["status"] in (JOB_QUEUED, JOB_RUNNING):
+                    return existing
+                await self.redis.set(rkey, job["id"], ex=JOB_RESULT_TTL)
+        await self.save(job)
+        await self.redis.lpush(self.ready_key, job["id"])
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        raw = await self.redis.get(self.job_key(job_id)) if job_id else None
+        return json.loads(raw) if raw else None
+
+    async def promote_delayed(self):
+        due = await self.redis.zrangebyscore(self.delayed_key, 0, time.time())
+        for job_id in due:
+            # zrem succeeds for exactly one worker, so a job is never promoted twice
+            if await self.redis.zrem(self.delayed_key, job_id):
+                await self.redis.lpush(self.ready_key, job_id)
+
+    async def reserve(self, timeout: float = 1.0) -> Optional[dict]:
+        await self.promote_delayed()
+        job_id = await self.redis.blmove(self.ready_key, self.processing_key, timeout, "RIGHT", "LEFT")
+        if job_id is None:
+            return None
+        await self.redis.zadd(self.leases_key, {job_id: time.time() + JOB_LEASE_TIMEOUT})
+        job = await self.get(job_id)
+        if job is None or job["status"] in (JOB_SUCCEEDED, JOB_FAILED):
+            # expired, or finished by a worker whose lease had lapsed
+            await self.release(job_id)
+            return None
+        job.update(status=JOB_RUNNING, attempts=job["attempts"] + 1, updated_at=datetime.utcnow().isoformat())
+        await self.save(job)
+        return job
+
+    async def keep_alive(self, job: dict):
+        """Renew the job's lease until cancelled by the worker running it."""
+        while True:
+            await asyncio.sleep(JOB_LEASE_TIMEOUT / 3)
+            try:
+                renewed = await self.redis.zadd(self.leases_key, {job["id"]: time.time() + JOB_LEASE_TIMEOUT}, xx=True, ch=True)
+            except Exception as e:
+                print(f"Could not renew lease of job {job['id']}: {e}")
+                continue
+            if not renewed:
+                print(f"Lease of job {job['id']} lapsed, it may run twice")
+
+    async def release(self, job_id: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing_key, 0, job_id)
+            pipe.zrem(self.leases_key, job_id)
+            await pipe.execute()
+
+    async def release_dedupe(self, job: dict):
+        if job.get("dedupe_key"):
+            rkey = self.dedupe_key(job["dedupe_key"])
+            if await self.redis.get(rkey) == job["id"]:
+                await self.redis.delete(rkey)
+
+    async def complete(self, job: dict, result: dict):
+        job.update(status=JOB_SUCCEEDED, result=result, error=None, updated_at=datetime.utcnow().isoformat())
+        await self.save(job, ttl=JOB_RESULT_TTL)
+        await self.release(job["id"])
+        await self.release_dedupe(job)
+
+    async def fail(self, job: dict, error: str, retry: bool = True):
+        job.update(error=error, updated_at=datetime.utcnow().isoformat())
+        if retry and job["attempts"] < job["max_attempts"]:
+            job["status"] = JOB_QUEUED
+            await self.save(job)
+            await self.redis.zadd(self.delayed_key, {job["id"]: time.time() + retry_delay(job["attempts"])})
+        else:
+            job["status"] = JOB_FAILED
+            await self.save(job, ttl=JOB_RESULT_TTL)
+            await self.release_dedupe(job)
+        await self.release(job["id"])
+
+    async def recover(self):
+        """Requeue jobs whose lease lapsed; safe to call while other workers are running."""
+        now = time.time()
+        # a worker that died between taking a job and leasing it leaves it unleased: lease it now
+        # (NX never shortens the lease of a live worker), so it is requeued once that lapses
+        processing = await self.redis.lrange(self.processing_key, 0, -1)
+        if processing:
+            await self.redis.zadd(self.leases_key, {job_id: now + JOB_LEASE_TIMEOUT for job_id in processing}, nx=True)
+        for job_id in await self.redis.zrangebyscore(self.leases_key, 0, now):
+            # zrem succeeds for exactly one caller, so a job is never requeued twice
+            if await self.redis.zrem(self.leases_key, job_id):
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    pipe.lrem(self.processing_key, 0, job_id)
+                    pipe.lpush(self.ready_key, job_id)
+                    await pipe.execute()
+                print(f"Requeued job {job_id}: its worker stopped renewing the lease")
+
+def create_job_queue():
+    if JOB_QUEUE_BACKEND == "redis":
+        return RedisJobQueue(REDIS_URL)
+    return MemoryJobQueue()
+
+job_queue = create_job_queue()
+
+async def sleep_unless_stopped(stop: asyncio.Event, seconds: float):
+    try:
+        await asyncio.wait_for(stop.wait(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+async def run_job(queue, job: dict):
+    """Run one reserved job and record its outcome; only errors of the queue itself propagate."""
+    handler = JOB_HANDLERS.get(job["kind"])
+    heartbeat = asyncio.create_task(queue.keep_alive(job))
+    try:
+        if handler is None:
+            raise PermanentJobError(f"Unknown job kind {job['kind']}")
+        result = await handler(job["payload"])
+    except PermanentJobError as e:
+        JOBS_PROCESSED.labels(job["kind"], "failed").inc()
+        await queue.fail(job, str(e), retry=False)
+    except HTTPException as e:
+        JOBS_PROCESSED.labels(job["kind"], "failed").inc()
+        await queue.fail(job, str(e.detail), retry=e.status_code >= 500)
+    except Exception as e:
+        print(f"Job {job['id']} ({job['kind']}) failed: {e}")
+        JOBS_PROCESSED.labels(job["kind"], "failed").inc()
+        await queue.fail(job, str(e))
+    else:
+        JOBS_PROCESSED.labels(job["kind"], "succeeded").inc()
+        await queue.complete(job, result)
+    finally:
+        heartbeat.cancel()
+
+async def job_worker_loop(queue, stop: asyncio.Event):
+    """Reserve and run jobs until stop is set.
+
+    A queue error (e.g. Redis unreachable) is logged and retried with backoff instead
+    of ending the worker; a job whose outcome could not be recorded keeps its lease
+    and is requeued by recover() once that lapses.
+    """
+    failures = 0
+    while not stop.is_set():
+        try:
+            job = await queue.reserve(timeout=1.0)
+            if job is not None:
+                await run_job(queue, job)
+            failures = 0
+        except Exception as e:
+            failures += 1
+            delay = min(0.5 * 2 ** (failures - 1), JOB_QUEUE_RETRY_MAX)
+            ERRORS.labels("job_queue").inc()
+            print(f"Job queue error ({e}), retrying in {delay:g}s")
+            await sleep_unless_stopped(stop, delay)
+
+async def job_recovery_loop(queue, stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            await queue.recover()
+        except Exception as e:
+            print(f"Job recovery failed: {e}")
+        await sleep_unless_stopped(stop, JOB_LEASE_TIMEOUT / 2)
+
+async def run_job_workers(concurrency: int, stop: Optional[asyncio.Event] = None):
+    stop = stop or asyncio.Event()
+    try:
+        await asyncio.gather(
+            job_recovery_loop(job_queue, stop),
+            *(job_worker_loop(job_queue, stop) for _ in range(concurrency)),
+        )
+    except Exception as e:
+        # started as a background task, which would otherwise end without a trace
+        print(f"Job workers stopped: {e}")
+        raise
@@ -0,0 +1,260 @@
+"""Mayan EDMS integration: pooled client with adaptive concurrency and the mayan_push job."""
+from sqlalchemy import select, update, or_, and_
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+from typing import Optional, List
+from contextlib import asynccontextmanager
+import os
+import asyncio
+import random
+import time
+import statistics
+from collections import deque
+import httpx
+
+from config import (
+    MAYAN_API_TOKEN, MAYAN_API_URL, MAYAN_CLAIM_TIMEOUT, MAYAN_DOCUMENT_TYPE_ID, MAYAN_MAX_ATTEMPTS,
+    MAYAN_MAX_CONCURRENCY, MAYAN_PASSWORD, MAYAN_RETRY_BACKOFF, MAYAN_SLOW_SECONDS,
+    MAYAN_SYNC_ON_UPLOAD, MAYAN_TIMEOUT, MAYAN_USERNAME, UPLOAD_DIR,
+)
+from metrics import ERRORS, MAYAN_CONCURRENCY, MAYAN_LATENCY, MAYAN_PUSHES
+from database import db_session
+from models import Document
+from response_cache import documents_changed
+from jobs import JOB_HANDLERS, PermanentJobError, job_queue
+
+MAYAN_PENDING, MAYAN_SYNCING, MAYAN_SYNCED, MAYAN_FAILED = "pending", "syncing", "synced", "failed"
+
+class MayanClient:
+    """Long-lived, keep-alive client for the Mayan EDMS REST API (v4).
+
+    Uploads wait for one of `limit` slots. The limit starts at 1, grows by one
+    after every prompt success up to max_concurrency and halves when Mayan is
+    slow, unreachable or answers 429/5xx; a Retry-After holds every new upload
+    until it has passed.
+    """
+
+    def __init__(self, base_url: str, token: str, username: str, password: str, timeout: float, max_concurrency: int, slow_seconds: float):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_concurrency = max(1, max_concurrency)
+        self.slow_seconds = slow_seconds
+        self.headers = {"Authorization": f"Token {token}"} if token else {}
+        self.auth = (username, password) if username and not token else None
+        self.limit = 1.0
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Condition] = None
+        self.calls = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=1000)
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.headers or self.auth)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits, headers=self.headers, auth=self.auth)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._slots = None
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._slots is None:
+            self._slots = asyncio.Condition()
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            async with self._slots:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    break
+                await self._slots.wait()
+        try:
+            yield
+        finally:
+            async with self._slots:
+                self.in_flight -= 1
+                self._slots.notify_all()
+
+    def pause(self, retry_after: Optional[str]):
+        try:
+            seconds = min(float(retry_after), 300)
+        except (TypeError, ValueError):
+            return
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def feedback(self, elapsed: float, overloaded: bool):
+        if overloaded or elapsed >= self.slow_seconds:
+            self.limit = max(1.0, self.limit / 2)
+        else:
+            self.limit = min(float(self.max_concurrency), self.limit + 1)
+        MAYAN_CONCURRENCY.set(self.limit)
+
+    async def upload(self, path: str, filename: str, label: str, description: str = "") -> str:
+        """Create a Mayan document from a stored file; returns its Mayan id."""
+        async with self.slot():
+            started = time.perf_counter()
+            overloaded = False
+            try:
+                with open(path, "rb") as f:
+                    response = await self.client.post(
+                        "/api/v4/documents/upload/",
+                        data={"document_type_id": str(MAYAN_DOCUMENT_TYPE_ID), "label": label, "description": description},
+                        files={"file": (filename, f)},
+                    )
+                if response.status_code == 429 or response.status_code >= 500:
+                    overloaded = True
+                    self.pause(response.headers.get("Retry-After"))
+                response.raise_for_status()
+                mayan_id = response.json().get("id")
+                if mayan_id is None:
+                    raise ValueError("Mayan response has no document id")
+            except Exception as e:
+                overloaded = overloaded or isinstance(e, httpx.TransportError)
+                self.errors += 1
+                ERRORS.labels("mayan").inc()
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                self.calls += 1
+                self.latencies.append(elapsed)
+                MAYAN_LATENCY.labels("upload").observe(elapsed)
+                self.feedback(elapsed, overloaded)
+        return str(mayan_id)
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "configured": self.configured,
+            "calls": self.calls,
+            "errors": self.errors,
+            "concurrency_limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 2),
+            "latency_p50": statistics.median(latencies) if latencies else None,
+            "latency_p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else None,
+        }
+
+mayan = MayanClient(MAYAN_API_URL, MAYAN_API_TOKEN, MAYAN_USERNAME, MAYAN_PASSWORD, MAYAN_TIMEOUT, MAYAN_MAX_CONCURRENCY, MAYAN_SLOW_SECONDS)
+
+def mayan_retriable(exc: Exception) -> bool:
+    if isinstance(exc, httpx.TransportError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in (408, 429) or exc.response.status_code >= 500
+    return False
+
+def mayan_claimable():
+    """Documents a push may take: never pushed, failed, or claimed by a push that never finished."""
+    stale = datetime.utcnow() - timedelta(seconds=MAYAN_CLAIM_TIMEOUT)
+    return or_(
+        Document.mayan_status.in_([MAYAN_PENDING, MAYAN_FAILED]),
+        Document.mayan_status.is_(None),
+        and_(Document.mayan_status == MAYAN_SYNCING, Document.mayan_updated_at < stale),
+    )
+
+async def record_mayan_result(document_id: int, status: str, mayan_id: Optional[str] = None, error: Optional[str] = None):
+    values = {"mayan_status": status, "mayan_updated_at": datetime.utcnow(), "mayan_error": error}
+    if mayan_id is not None:
+        values["mayan_id"] = mayan_id
+    async with db_session() as db:
+        try:
+            await db.execute(update(Document).where(Document.id == document_id).values(**values))
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            await db.execute(update(Document).where(Document.id == document_id).values(
+                mayan_status=MAYAN_FAILED,
+                mayan_updated_at=datetime.utcnow(),
+                mayan_error=f"Mayan document {mayan_id} is already linked to another document",
+            ))
+            await db.commit()
+            await documents_changed(document_id)
+            return MAYAN_FAILED
+    await documents_changed(document_id)
+    return status
+
+async def push_document_to_mayan(document_id: int) -> str:
+    """Upload one stored file to Mayan and write the Mayan id back to mayan_id.
+
+    The row is claimed first (mayan_status=syncing), so two jobs never push the
+    same document; transient failures are retried with backoff before the
+    document is marked failed. No database connection is held during the upload.
+    """
+    async with db_session() as db:
+        claimed = await db.execute(
+            update(Document)
+            .where(Document.id == document_id, mayan_claimable())
+            .values(mayan_status=MAYAN_SYNCING, mayan_updated_at=datetime.utcnow())
+        )
+        if claimed.rowcount != 1:
+            await db.rollback()
+            return "skipped"
+        doc = (await db.execute(
+            select(Document.title, Document.description, Document.file_path).where(Document.id == document_id)
+        )).first()
+        await db.commit()
+    await documents_changed(document_id)
+
+    error = None
+    for attempt in range(1, MAYAN_MAX_ATTEMPTS + 1):
+        try:
+            if not doc.file_path:
+                raise FileNotFoundError("Document has no stored file")
+            label = doc.title or f"Document {document_id}"
+            mayan_id = await mayan.upload(
+                os.path.join(UPLOAD_DIR, doc.file_path),
+                filename=label + os.path.splitext(doc.file_path)[1],
+                label=label,
+                description=doc.description or "",
+            )
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:500]
+            if not mayan_retriable(e) or attempt == MAYAN_MAX_ATTEMPTS:
+                break
+            # full jitter, so documents that failed together do not retry together
+            await asyncio.sleep(random.uniform(0, MAYAN_RETRY_BACKOFF * 2 ** (attempt - 1)))
+            continue
+        status = await record_mayan_result(document_id, MAYAN_SYNCED, mayan_id=mayan_id)
+        MAYAN_PUSHES.labels(status).inc()
+        return status
+    status = await record_mayan_result(document_id, MAYAN_FAILED, error=error)
+    MAYAN_PUSHES.labels(status).inc()
+    return status
+
+async def handle_mayan_push_job(payload: dict) -> dict:
+    if not mayan.configured:
+        raise PermanentJobError("Mayan sync is not configured")
+    # the client adapts how many uploads actually run; this only bounds the DB work around them
+    limit = asyncio.Semaphore(MAYAN_MAX_CONCURRENCY)
+
+    async def push(document_id: int) -> str:
+        async with limit:
+            return await push_document_to_mayan(document_id)
+
+    outcomes = await asyncio.gather(*(push(document_id) for document_id in payload["document_ids"]))
+    counts = {}
+    for outcome in outcomes:
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return {"documents": len(outcomes), **counts}
+
+JOB_HANDLERS["mayan_push"] = handle_mayan_push_job
+
+async def enqueue_mayan_push(document_ids: List[int], user_id: Optional[int]) -> Optional[dict]:
+    """Queue the push of freshly uploaded documents when MAYAN_SYNC_ON_UPLOAD is on."""
+    if not (MAYAN_SYNC_ON_UPLOAD and mayan.configured and document_ids):
+        return None
+    dedupe_key = f"mayan:{document_ids[0]}" if len(document_ids) == 1 else None
+    return await job_queue.enqueue("mayan_push", {"document_ids": document_ids}, dedupe_key=dedupe_key, user_id=user_id)
@@ -0,0 +1,150 @@
+"""Prometheus metrics and the per-request Server-Timing breakdown."""
+from sqlalchemy import event
+from typing import Optional
+from contextvars import ContextVar
+import os
+import time
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+
+from config import SERVER_TIMING
+
+# every process exports its own metrics unless PROMETHEUS_MULTIPROC_DIR is set (multi-worker servers)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route template",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "Requests being served", multiprocess_mode="livesum")
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Time spent executing SQL statements",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+)
+HASH_LATENCY = Histogram(
+    "password_hash_duration_seconds", "bcrypt time including queueing in the hash pool",
+    ["operation"], buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+EXTRACT_LATENCY = Histogram(
+    "extract_duration_seconds", "Text extraction time by file type",
+    ["file_type"], buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+EXTRACT_PAGES = Counter("extract_pages_total", "Pages (or paragraphs) parsed by file type", ["file_type"])
+OLLAMA_LATENCY = Histogram(
+    "ollama_request_duration_seconds", "Ollama API call latency",
+    ["endpoint"], buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+OLLAMA_TOKENS = Counter("ollama_tokens_total", "Tokens processed by Ollama", ["kind"])
+MAYAN_LATENCY = Histogram(
+    "mayan_request_duration_seconds", "Mayan API call latency",
+    ["endpoint"], buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+MAYAN_PUSHES = Counter("mayan_pushes_total", "Document pushes to Mayan by outcome", ["outcome"])
+PREVIEW_LATENCY = Histogram(
+    "preview_render_duration_seconds", "Preview rendering time by file type",
+    ["file_type"], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+PREVIEW_CACHE_EVENTS = Counter("preview_cache_events_total", "Preview lookups, renders and evictions", ["event"])
+MAYAN_CONCURRENCY = Gauge("mayan_concurrency_limit", "Current adaptive limit of uploads in flight to Mayan", multiprocess_mode="liveall")
+UPLOAD_BYTES = Counter("upload_bytes_total", "Bytes received in document uploads")
+UPLOADED_DOCUMENTS = Counter("uploaded_documents_total", "Documents created by uploads", ["endpoint"])
+IMPORTED_USERS = Counter("imported_users_total", "Rows of bulk user imports by outcome", ["outcome"])
+JOBS_PROCESSED = Counter("jobs_processed_total", "Background jobs by outcome", ["kind", "outcome"])
+ERRORS = Counter("app_errors_total", "Errors by kind", ["kind"])
+
+EXTRACT_FILE_TYPES = {".pdf", ".docx", ".txt", ".md", ".csv"}
+
+# per-request stage durations for Server-Timing; None outside requests or when disabled
+request_timings: ContextVar[Optional[dict]] = ContextVar("request_timings", default=None)
+
+def record_stage(stage: str, seconds: float):
+    timings = request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+def file_type_label(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    return ext if ext in EXTRACT_FILE_TYPES else "other"
+
+def instrument_engine(sync_engine):
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_started
+        DB_QUERY_LATENCY.observe(elapsed)
+        record_stage("db", elapsed)
+
+class PoolCollector:
+    """Connection pool gauges, read at scrape time so requests pay nothing for them.
+
+    engines() returns the (label, sync engine) pairs created so far.
+    """
+
+    def __init__(self, engines):
+        self.engines = engines
+
+    def collect(self):
+        gauges = {
+            name: GaugeMetricFamily(f"db_pool_{name}", help_text, labels=["engine"])
+            for name, help_text in (
+                ("size", "Configured pool size"),
+                ("checked_out", "Connections in use"),
+                ("overflow", "Connections open beyond the pool size"),
+            )
+        }
+        for label, eng in self.engines():
+            pool = eng.pool
+            for name, method in (("size", "size"), ("checked_out", "checkedout"), ("overflow", "overflow")):
+                if hasattr(pool, method):
+                    # QueuePool.overflow() counts up from -pool_size
+                    gauges[name].add_metric([label], max(0, getattr(pool, method)()))
+        yield from gauges.values()
+
+class MetricsMiddleware:
+    """Per-route latency histogram, in-flight gauge, 5xx counter and optional Server-Timing header."""
+
+    def __init__(self, app):
+        self.app = app
+        self.route_paths = None
+
+    def route_label(self, scope) -> str:
+        if self.route_paths is None:
+            self.route_paths = {
+                route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")
+            }
+        path = self.route_paths.get(scope.get("endpoint"))
+        if path is not None:
+            return path
+        # no per-path labels for unmatched URLs, which would explode cardinality
+        return "/uploads" if scope["path"].startswith("/uploads/") else "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        timings = {} if SERVER_TIMING else None
+        token = request_timings.set(timings)
+        status = 500
+
+        async def send_with_metrics(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timings is not None:
+                    timings["app"] = time.perf_counter() - started
+                    header = ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            REQUEST_LATENCY.labels(scope["method"], self.route_label(scope), str(status)).observe(time.perf_counter() - started)
+            if status >= 500:
+                ERRORS.labels("http_5xx").inc()
+            request_timings.reset(token)
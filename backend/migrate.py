@@ -0,0 +1,49 @@
+"""Create and migrate the database schema once per deploy: `python migrate.py`, then start the API with AUTO_MIGRATE=false.
+
+Tables from earlier releases get their new columns added and their indexes created,
+or rebuilt when an index of the same name covers other columns, in place
+(see models.migrate_schema); running it again is a no-op.
+
+Waits for the database to accept connections (MIGRATE_WAIT_TIMEOUT seconds)
+instead of relying on a fixed sleep before startup.
+"""
+import os
+import sys
+import time
+
+from sqlalchemy.exc import OperationalError
+
+import models
+from database import get_engine
+
+
+def wait_for_database(timeout: float):
+    deadline = time.monotonic() + timeout
+    delay = 0.25
+    while True:
+        try:
+            with get_engine().connect():
+                return
+        except OperationalError as e:
+            if time.monotonic() + delay > deadline:
+                raise
+            print(f"Database not ready ({str(e.orig).strip()}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
+
+
+def main():
+    started = time.perf_counter()
+    try:
+        wait_for_database(float(os.getenv("MIGRATE_WAIT_TIMEOUT", "60")))
+    except OperationalError as e:
+        print(f"Database unavailable: {e.orig}")
+        sys.exit(1)
+    models.prepare_storage()
+    models.init_database()
+    get_engine().dispose()
+    print(f"Schema up to date in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""ORM models, storage directories and the in-place schema migration."""
+from sqlalchemy import Column, String, DateTime, Boolean, Integer, BigInteger, Text, Index, select, update, func, text, literal_column
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.schema import CreateIndex, DropIndex
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from datetime import datetime
+import os
+
+from config import SEARCH_CONFIG, SEARCH_TEXT_CHARS, UPLOAD_DIR, UPLOAD_TMP_DIR
+from database import Base, DB_DIALECT, get_engine
+
+class User(Base):
+    __tablename__ = "users"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String, unique=True, index=True)
+    hashed_password = Column(String)
+    full_name = Column(String)
+    role = Column(String, default="user")  # "user" or "admin"
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AccessWindow(Base):
+    __tablename__ = "access_windows"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, index=True)
+    start_time = Column(String)  # "HH:MM"
+    end_time = Column(String)    # "HH:MM"
+    weekday = Column(Integer, nullable=True)  # 0 = Monday; NULL = every day
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class Document(Base):
+    __tablename__ = "documents"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    mayan_id = Column(String, unique=True, index=True)
+    title = Column(String)
+    description = Column(Text)
+    uploaded_by = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    ai_summary = Column(Text, nullable=True)
+    ai_keywords = Column(Text, nullable=True)
+    file_path = Column(String, nullable=True)
+    file_size = Column(BigInteger, nullable=True)
+    sha256 = Column(String(64), nullable=True, index=True)
+    # mayan_id holds a local placeholder until the file has been pushed to Mayan (see push_document_to_mayan)
+    mayan_status = Column(String(16), default="pending", server_default="pending")
+    mayan_updated_at = Column(DateTime, nullable=True)
+    mayan_error = Column(Text, nullable=True)
+    # weighted title/description/keywords/summary/extracted text, see refresh_search_vectors()
+    search_vector = Column(TSVECTOR().with_variant(Text(), "sqlite"), nullable=True)
+
+    # keyset pagination on (created_at, id), optionally scoped to one uploader
+    __table_args__ = (
+        Index("idx_documents_uploaded_by", "uploaded_by", "created_at", "id"),
+        Index("idx_documents_created_at", "created_at", "id"),
+        Index("idx_documents_search", "search_vector", postgresql_using="gin"),
+        Index("idx_documents_mayan_status", "mayan_status", "id"),
+    )
+
+# ai_summary stored for a document Ollama could not analyze
+ANALYSIS_FAILED = "Analysis failed"
+
+class Blob(Base):
+    """Content-addressed upload shared by every document with the same SHA-256."""
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    file_path = Column(String, nullable=False)  # relative to UPLOAD_DIR
+    file_size = Column(BigInteger)
+    ref_count = Column(Integer, default=0, nullable=False)
+    # extracted text, filled the first time the content is parsed; extracted_partial marks a
+    # prefix stored by an early-stopped (max_chars) parse, which only serves requests it covers
+    extracted_text = Column(Text, nullable=True)
+    extracted_partial = Column(Boolean, nullable=True)
+    page_count = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AnalysisChunk(Base):
+    """Cached map/reduce step output, keyed by a digest of model, stage and input text."""
+    __tablename__ = "analysis_chunks"
+
+    key = Column(String(64), primary_key=True)
+    summary = Column(Text)
+    keywords = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AnalysisBatch(Base):
+    """Progress of a batch analysis run, so an interrupted batch can be resumed."""
+    __tablename__ = "analysis_batches"
+
+    id = Column(String(32), primary_key=True)
+    created_by = Column(Integer)
+    document_ids = Column(Text, nullable=False)  # JSON list, ascending
+    # every document before this position has its result committed
+    completed = Column(Integer, default=0, nullable=False)
+    succeeded = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    # running (claimed by a stream), interrupted or completed
+    status = Column(String(20), default="running", nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class SessionModel(Base):
+    __tablename__ = "sessions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, index=True)
+    token = Column(String, unique=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime)
+
+def prepare_storage():
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+
+# columns added to tables that databases from earlier releases (or init-db.sql) already have;
+# create_all() only creates missing tables, so these are added in place by migrate_schema()
+ADDED_COLUMNS = [
+    ("access_windows", "weekday"),
+    ("documents", "file_path"),
+    ("documents", "file_size"),
+    ("documents", "sha256"),
+    ("documents", "mayan_status"),
+    ("documents", "mayan_updated_at"),
+    ("documents", "mayan_error"),
+    ("documents", "search_vector"),
+    ("blobs", "extracted_text"),
+    ("blobs", "page_count"),
+    ("blobs", "extracted_partial"),
+]
+# indexes replaced by the composite ones declared on the models
+DROPPED_INDEXES = ["ix_documents_uploaded_by"]
+MIGRATE_BATCH_SIZE = 1000
+
+def add_column_sql(conn, table_name: str, column_name: str) -> str:
+    column = Base.metadata.tables[table_name].c[column_name]
+    ddl = f"{column.name} {column.type.compile(dialect=conn.dialect)}"
+    if column.server_default is not None:
+        # applied to the existing rows as well, e.g. legacy documents become mayan_status='pending'
+        ddl += f" DEFAULT '{column.server_default.arg}'"
+    # SQLite has no ADD COLUMN IF NOT EXISTS; the inspector check in migrate_schema() covers it
+    if_not_exists = "" if conn.dialect.name == "sqlite" else "IF NOT EXISTS "
+    return f"ALTER TABLE {table_name} ADD COLUMN {if_not_exists}{ddl}"
+
+def backfill_file_sizes(conn):
+    """Fill documents.file_size from the stored files for rows uploaded before the column existed."""
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(Document.id, Document.file_path)
+            .where(Document.id > last_id, Document.file_size.is_(None), Document.file_path.isnot(None))
+            .order_by(Document.id).limit(MIGRATE_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        for row in rows:
+            path = os.path.join(UPLOAD_DIR, row.file_path)
+            if os.path.isfile(path):
+                conn.execute(update(Document).where(Document.id == row.id).values(file_size=os.path.getsize(path)))
+        conn.commit()
+        last_id = rows[-1].id
+
+def backfill_search_vectors(conn):
+    """Index documents stored before full-text search existed (PostgreSQL only, like refresh_search_vectors)."""
+    if conn.dialect.name != "postgresql":
+        return
+    last_id = 0
+    while True:
+        ids = conn.execute(
+            select(Document.id).where(Document.id > last_id, Document.search_vector.is_(None))
+            .order_by(Document.id).limit(MIGRATE_BATCH_SIZE)
+        ).scalars().all()
+        if not ids:
+            return
+        conn.execute(
+            update(Document).where(Document.id.in_(ids)).values(search_vector=search_vector_expression())
+            .execution_options(synchronize_session=False)
+        )
+        conn.commit()
+        last_id = ids[-1]
+
+def migrate_schema(conn):
+    """Bring tables created by an earlier release up to the current models. Safe to run repeatedly."""
+    inspector = sa_inspect(conn)
+    tables = set(inspector.get_table_names())
+    for table_name, column_name in ADDED_COLUMNS:
+        if table_name not in tables:
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table_name)}
+        if column_name not in existing:
+            print(f"Adding column {table_name}.{column_name}")
+            conn.execute(text(add_column_sql(conn, table_name, column_name)))
+    for index_name in DROPPED_INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+    for table in Base.metadata.sorted_tables:
+        existing = {i["name"]: i["column_names"] for i in sa_inspect(conn).get_indexes(table.name)}
+        for index in table.indexes:
+            columns = [column.name for column in index.columns]
+            if existing.get(index.name) == columns:
+                continue
+            if index.name in existing:
+                # same name on other columns, e.g. idx_documents_uploaded_by(uploaded_by) from the old init-db.sql
+                print(f"Rebuilding index {index.name} on ({', '.join(columns)})")
+                conn.execute(DropIndex(index, if_exists=True))
+            else:
+                print(f"Creating index {index.name}")
+            conn.execute(CreateIndex(index, if_not_exists=True))
+    conn.commit()
+    backfill_file_sizes(conn)
+    backfill_search_vectors(conn)
+
+def init_database():
+    """Create missing tables and migrate existing ones.
+
+    Runs once per deploy (`python migrate.py`), or at startup when AUTO_MIGRATE is on.
+    """
+    Base.metadata.create_all(bind=get_engine())
+    with get_engine().connect() as conn:
+        migrate_schema(conn)
+
+def search_config():
+    return literal_column(f"'{SEARCH_CONFIG}'::regconfig")
+
+def search_vector_expression():
+    def weighted(column, weight):
+        # literal "char" weight: asyncpg would otherwise bind it as varchar, which setweight() rejects
+        return func.setweight(func.to_tsvector(search_config(), func.coalesce(column, "")), literal_column(f"'{weight}'::\"char\""))
+
+    body = (
+        select(func.left(Blob.extracted_text, SEARCH_TEXT_CHARS))
+        .where(Blob.sha256 == Document.sha256)
+        .scalar_subquery()
+    )
+    return (
+        weighted(Document.title, "A")
+        .op("||")(weighted(Document.description, "B"))
+        .op("||")(weighted(Document.ai_keywords, "B"))
+        .op("||")(weighted(Document.ai_summary, "C"))
+        .op("||")(weighted(body, "D"))
+    )
+
+async def refresh_search_vectors(db: AsyncSession, *conditions):
+    """Recompute search_vector for the matching rows inside the caller's transaction."""
+    if DB_DIALECT != "postgresql":
+        return
+    await db.execute(
+        update(Document).where(*conditions).values(search_vector=search_vector_expression())
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,163 @@
+"""Shared, model-aware client for the Ollama HTTP API."""
+from typing import Optional, List
+import asyncio
+import json
+import time
+import statistics
+from collections import deque
+import httpx
+
+from config import OLLAMA_API_URL, OLLAMA_MAX_CONNECTIONS, OLLAMA_MAX_KEEPALIVE, OLLAMA_MODEL, OLLAMA_TIMEOUT
+from metrics import ERRORS, OLLAMA_LATENCY, OLLAMA_TOKENS, record_stage
+
+class OllamaClient:
+    """Long-lived, keep-alive client for the Ollama HTTP API.
+
+    The model is looked up once in /api/tags (pulled only if missing) and
+    every generate call records its latency and token counts.
+    """
+
+    def __init__(self, base_url: str, model: str, timeout: float, max_connections: int, max_keepalive: int):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._ready_models = set()
+        self._model_lock: Optional[asyncio.Lock] = None
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = deque(maxlen=1000)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._model_lock = None
+
+    async def ensure_model(self, model: Optional[str] = None):
+        model = model or self.model
+        if model in self._ready_models:
+            return
+        if self._model_lock is None:
+            self._model_lock = asyncio.Lock()
+        async with self._model_lock:
+            if model in self._ready_models:
+                return
+            response = await self.client.get("/api/tags")
+            response.raise_for_status()
+            names = {m.get("name", "") for m in response.json().get("models", [])}
+            if model not in names and f"{model}:latest" not in names:
+                pull = await self.client.post("/api/pull", json={"name": model, "stream": False}, timeout=None)
+                pull.raise_for_status()
+            self._ready_models.add(model)
+
+    async def generate(self, prompt: str, format: Optional[str] = None, **options) -> dict:
+        await self.ensure_model()
+        body = {"model": self.model, "prompt": prompt, "stream": False}
+        if format:
+            body["format"] = format
+        if options:
+            body["options"] = options
+        started = time.perf_counter()
+        try:
+            response = await self.client.post("/api/generate", json=body)
+            if response.status_code == 404:
+                # model was removed behind our back; look it up again next time
+                self._ready_models.discard(self.model)
+            response.raise_for_status()
+        except Exception:
+            self.errors += 1
+            ERRORS.labels("ollama").inc()
+            raise
+        finally:
+            self.record_call("generate", time.perf_counter() - started)
+        data = response.json()
+        self.record_tokens(data)
+        return data
+
+    def record_call(self, endpoint: str, elapsed: float):
+        self.calls += 1
+        self.latencies.append(elapsed)
+        OLLAMA_LATENCY.labels(endpoint).observe(elapsed)
+        record_stage("ollama", elapsed)
+
+    def record_tokens(self, data: dict):
+        prompt_tokens = data.get("prompt_eval_count", 0) or 0
+        completion_tokens = data.get("eval_count", 0) or 0
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        OLLAMA_TOKENS.labels("prompt").inc(prompt_tokens)
+        OLLAMA_TOKENS.labels("completion").inc(completion_tokens)
+
+    async def generate_stream(self, prompt: str, **options):
+        """Yield response tokens as Ollama produces them.
+
+        Closing the generator (e.g. on client disconnect) closes the upstream
+        connection, which makes Ollama stop generating.
+        """
+        await self.ensure_model()
+        body = {"model": self.model, "prompt": prompt, "stream": True}
+        if options:
+            body["options"] = options
+        started = time.perf_counter()
+        try:
+            async with self.client.stream("POST", "/api/generate", json=body) as response:
+                if response.status_code == 404:
+                    self._ready_models.discard(self.model)
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    data = json.loads(line)
+                    if data.get("response"):
+                        yield data["response"]
+                    if data.get("done"):
+                        self.record_tokens(data)
+                        break
+        except Exception:
+            self.errors += 1
+            ERRORS.labels("ollama").inc()
+            raise
+        finally:
+            self.record_call("generate_stream", time.perf_counter() - started)
+
+    async def embed(self, text: str, model: str) -> List[float]:
+        await self.ensure_model(model)
+        started = time.perf_counter()
+        try:
+            response = await self.client.post("/api/embeddings", json={"model": model, "prompt": text})
+            if response.status_code == 404:
+                self._ready_models.discard(model)
+            response.raise_for_status()
+        except Exception:
+            self.errors += 1
+            ERRORS.labels("ollama").inc()
+            raise
+        finally:
+            self.record_call("embed", time.perf_counter() - started)
+        return response.json()["embedding"]
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "model": self.model,
+            "model_ready": self.model in self._ready_models,
+            "calls": self.calls,
+            "errors": self.errors,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "latency_p50": statistics.median(latencies) if latencies else None,
+            "latency_p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else None,
+            "latency_max": latencies[-1] if latencies else None,
+        }
+
+ollama = OllamaClient(OLLAMA_API_URL, OLLAMA_MODEL, OLLAMA_TIMEOUT, OLLAMA_MAX_CONNECTIONS, OLLAMA_MAX_KEEPALIVE)
@@ -0,0 +1,250 @@
+"""Thumbnails and page previews, rendered in their own process pool and cached per content digest."""
+from fastapi import HTTPException
+from typing import Optional, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import os
+import asyncio
+import json
+import uuid
+import time
+import shutil
+
+from config import (
+    PREVIEWS_ENABLED, PREVIEW_CACHE_BYTES, PREVIEW_DIR, PREVIEW_JPEG_QUALITY, PREVIEW_MAX_PAGES,
+    PREVIEW_PAGE_WIDTH, PREVIEW_POOL_WORKERS, PREVIEW_THUMB_WIDTH, PREVIEW_TIMEOUT, UPLOAD_DIR,
+)
+from metrics import PREVIEW_CACHE_EVENTS, PREVIEW_LATENCY
+from jobs import JOB_HANDLERS, job_queue
+
+PREVIEW_FILE_TYPES = {".pdf", ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff"}
+PREVIEW_MANIFEST = "manifest.json"
+
+def render_previews_sync(file_path: str, out_dir: str, thumb_width: int, page_width: int,
+                         max_pages: int, quality: int) -> dict:
+    """Render a first-page thumbnail and up to max_pages page images (JPEG) into out_dir.
+
+    Runs inside the preview process pool. Everything is written to a scratch
+    directory that is renamed into place, so readers never see half a preview.
+    """
+    import fitz  # PyMuPDF
+
+    os.makedirs(os.path.dirname(out_dir), exist_ok=True)
+    scratch = f"{out_dir}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    os.makedirs(scratch)
+    try:
+        with fitz.open(file_path) as doc:
+            rendered = min(doc.page_count, max_pages)
+            if rendered == 0:
+                raise ValueError("no pages")
+            for number in range(rendered):
+                page = doc[number]
+                targets = [(f"page-{number + 1}.jpg", page_width)]
+                if number == 0:
+                    targets.append(("thumbnail.jpg", thumb_width))
+                for name, width in targets:
+                    # very tall pages are capped at three times the target width
+                    zoom = min(width / page.rect.width, 3 * width / page.rect.height)
+                    pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+                    pixmap.save(os.path.join(scratch, name), jpg_quality=quality)
+            manifest = {"page_count": doc.page_count, "pages": rendered}
+        with open(os.path.join(scratch, PREVIEW_MANIFEST), "w") as f:
+            json.dump(manifest, f)
+        size = sum(entry.stat().st_size for entry in os.scandir(scratch))
+    except Exception as e:
+        shutil.rmtree(scratch, ignore_errors=True)
+        # PyMuPDF exceptions do not always survive pickling back to the parent
+        raise RuntimeError(f"Preview rendering failed: {e}")
+    try:
+        os.rename(scratch, out_dir)
+    except OSError:
+        # another process rendered the same content first
+        shutil.rmtree(scratch, ignore_errors=True)
+        size = 0
+    return {**manifest, "bytes": size}
+
+_preview_executor: Optional[ProcessPoolExecutor] = None
+_preview_slots = asyncio.Semaphore(PREVIEW_POOL_WORKERS)
+
+def get_preview_executor() -> ProcessPoolExecutor:
+    global _preview_executor
+    if _preview_executor is None:
+        _preview_executor = ProcessPoolExecutor(max_workers=PREVIEW_POOL_WORKERS)
+    return _preview_executor
+
+def reset_preview_executor():
+    global _preview_executor
+    executor, _preview_executor = _preview_executor, None
+    if executor is not None:
+        for process in list(getattr(executor, "_processes", {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+class PreviewStore:
+    """Rendered previews on disk, one directory per content digest, evicted least recently used.
+
+    A directory's mtime is its last use (refreshed at most every touch_interval
+    when served), so every process sharing PREVIEW_DIR agrees on the order.
+    Usage is a running estimate, re-measured by a full scan once it crosses
+    the capacity.
+    """
+
+    touch_interval = 3600
+
+    def __init__(self, root: str, capacity: int):
+        self.root = root
+        self.capacity = capacity
+        self.usage: Optional[int] = None
+        self._evicting = False
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def exists(self, sha256: str) -> bool:
+        return os.path.isdir(self.path(sha256))
+
+    def manifest(self, sha256: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.path(sha256), PREVIEW_MANIFEST)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def touch(self, sha256: str):
+        directory = self.path(sha256)
+        try:
+            if time.time() - os.stat(directory).st_mtime > self.touch_interval:
+                os.utime(directory)
+        except FileNotFoundError:
+            pass
+
+    def remove(self, sha256: str):
+        shutil.rmtree(self.path(sha256), ignore_errors=True)
+
+    def scan(self) -> List[Tuple[float, int, str]]:
+        """(last use, bytes, path) of every preview; also clears scratch directories of crashed renders."""
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    mtime = entry.stat().st_mtime
+                    if entry.name.endswith(".tmp"):
+                        if time.time() - mtime > self.touch_interval:
+                            shutil.rmtree(entry.path, ignore_errors=True)
+                        continue
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                except FileNotFoundError:
+                    continue  # evicted by another process meanwhile
+                entries.append((mtime, size, entry.path))
+        return entries
+
+    def evict(self) -> int:
+        """Delete the least recently used previews down to 90% of capacity; returns the usage left."""
+        entries = sorted(self.scan())
+        usage = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if usage <= self.capacity * 0.9:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            usage -= size
+            PREVIEW_CACHE_EVENTS.labels("evicted").inc()
+        return usage
+
+    async def added(self, size: int):
+        loop = asyncio.get_running_loop()
+        if self.usage is None:
+            # first render since start: measure what earlier runs left behind (this one included)
+            self.usage = sum(size for _, size, _ in await loop.run_in_executor(None, self.scan))
+        else:
+            self.usage += size
+        if self.usage > self.capacity and not self._evicting:
+            self._evicting = True
+            try:
+                self.usage = await loop.run_in_executor(None, self.evict)
+            finally:
+                self._evicting = False
+
+    def stats(self) -> dict:
+        return {"directory": self.root, "usage_bytes": self.usage, "capacity_bytes": self.capacity}
+
+preview_store = PreviewStore(PREVIEW_DIR, PREVIEW_CACHE_BYTES)
+# renders in progress in this process, shared by concurrent requests for the same content
+_preview_renders = {}
+
+async def ensure_previews(sha256: str, file_path: str) -> dict:
+    """Manifest ({page_count, pages}) of the previews of sha256, rendering them first if needed."""
+    manifest = preview_store.manifest(sha256)
+    if manifest is not None:
+        PREVIEW_CACHE_EVENTS.labels("hit").inc()
+        preview_store.touch(sha256)
+        return manifest
+    task = _preview_renders.get(sha256)
+    if task is None:
+        task = asyncio.ensure_future(render_previews(sha256, file_path))
+        _preview_renders[sha256] = task
+        task.add_done_callback(lambda _: _preview_renders.pop(sha256, None))
+    # one caller going away must not cancel the render for the others
+    return await asyncio.shield(task)
+
+async def render_previews(sha256: str, file_path: str) -> dict:
+    loop = asyncio.get_running_loop()
+    async with _preview_slots:
+        # timed from here so that renders waiting for a pool slot do not time out
+        started = time.perf_counter()
+        for attempt in range(2):
+            future = loop.run_in_executor(
+                get_preview_executor(), render_previews_sync, file_path, preview_store.path(sha256),
+                PREVIEW_THUMB_WIDTH, PREVIEW_PAGE_WIDTH, PREVIEW_MAX_PAGES, PREVIEW_JPEG_QUALITY,
+            )
+            try:
+                result = await asyncio.wait_for(future, PREVIEW_TIMEOUT)
+                break
+            except asyncio.TimeoutError:
+                reset_preview_executor()
+                PREVIEW_CACHE_EVENTS.labels("failed").inc()
+                raise HTTPException(status_code=504, detail=f"Preview rendering timed out after {PREVIEW_TIMEOUT:g}s")
+            except BrokenProcessPool:
+                if attempt:
+                    raise HTTPException(status_code=500, detail="Preview worker crashed")
+                reset_preview_executor()
+            except RuntimeError as e:
+                PREVIEW_CACHE_EVENTS.labels("failed").inc()
+                raise HTTPException(status_code=422, detail=str(e))
+        PREVIEW_LATENCY.labels(os.path.splitext(file_path)[1].lower()).observe(time.perf_counter() - started)
+    PREVIEW_CACHE_EVENTS.labels("rendered").inc()
+    await preview_store.added(result.pop("bytes"))
+    return result
+
+async def handle_previews_job(payload: dict) -> dict:
+    async def render(sha256: str, file_path: str) -> bool:
+        try:
+            await ensure_previews(sha256, os.path.join(UPLOAD_DIR, file_path))
+            return True
+        except HTTPException as e:
+            # a file PyMuPDF cannot render will not get better on retry; it is rendered again on demand
+            print(f"Preview of {sha256[:12]} failed: {e.detail}")
+            return False
+
+    outcomes = await asyncio.gather(*(render(sha256, file_path) for sha256, file_path in payload["blobs"]))
+    return {"rendered": sum(outcomes), "failed": len(outcomes) - sum(outcomes)}
+
+JOB_HANDLERS["render_previews"] = handle_previews_job
+
+async def enqueue_previews(blobs: List[Tuple[str, str]], user_id: Optional[int]) -> Optional[dict]:
+    """Queue preview rendering for freshly stored (sha256, file_path) pairs that have none yet."""
+    if not PREVIEWS_ENABLED:
+        return None
+    todo = {}
+    for sha256, file_path in blobs:
+        if (sha256 and file_path and sha256 not in todo
+                and os.path.splitext(file_path)[1].lower() in PREVIEW_FILE_TYPES
+                and not preview_store.exists(sha256)):
+            todo[sha256] = file_path
+    if not todo:
+        return None
+    dedupe_key = f"previews:{next(iter(todo))}" if len(todo) == 1 else None
+    return await job_queue.enqueue("render_previews", {"blobs": list(todo.items())}, dedupe_key=dedupe_key, user_id=user_id)
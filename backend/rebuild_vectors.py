@@ -0,0 +1,22 @@
+"""Rebuild of the semantic search index from the documents table: `python rebuild_vectors.py`.
+
+The API may keep serving meanwhile: embeddings its processes add (or remove)
+during the rebuild are carried over into the new index when it is swapped in.
+"""
+import asyncio
+import time
+
+from config import VECTOR_INDEX_DIR
+from ollama_client import ollama
+from vectors import rebuild_vector_index
+
+
+async def main():
+    started = time.perf_counter()
+    rows = await rebuild_vector_index()
+    await ollama.aclose()
+    print(f"Indexed {rows} documents in {time.perf_counter() - started:.1f}s -> {VECTOR_INDEX_DIR}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
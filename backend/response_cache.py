@@ -0,0 +1,145 @@
+"""Resource versions behind the weak ETags of read endpoints, and the optional body cache."""
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from typing import Optional, List, Tuple
+import json
+import uuid
+import hashlib
+from collections import OrderedDict
+
+from config import REDIS_URL, RESOURCE_VERSIONS_BACKEND, RESPONSE_CACHE_BYTES, RESPONSE_MAX_AGE
+from models import User
+
+class MemoryVersions:
+    """Per-process resource version counters; the epoch keeps ETags from before a restart stale."""
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._versions = {}
+
+    async def current(self, *keys: str) -> str:
+        return ".".join([self.epoch] + [str(self._versions.get(key, 0)) for key in keys])
+
+    async def bump(self, *keys: str):
+        for key in keys:
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+class RedisVersions:
+    """Resource version counters shared by every process through Redis (INCR / MGET)."""
+
+    prefix = "coffrefort:versions"
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis_asyncio
+        self.redis = redis_asyncio.from_url(url, decode_responses=True)
+        self.epoch_key = f"{self.prefix}:epoch"
+
+    async def current(self, *keys: str) -> str:
+        values = await self.redis.mget(self.epoch_key, *[f"{self.prefix}:{key}" for key in keys])
+        if values[0] is None:
+            # a flushed Redis restarts the counters, so it must not reuse the old ETags
+            await self.redis.set(self.epoch_key, uuid.uuid4().hex[:8], nx=True)
+            values[0] = await self.redis.get(self.epoch_key)
+        return ".".join([values[0]] + [v or "0" for v in values[1:]])
+
+    async def bump(self, *keys: str):
+        if not keys:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.incr(f"{self.prefix}:{key}")
+            await pipe.execute()
+
+def create_resource_versions():
+    if RESOURCE_VERSIONS_BACKEND == "redis":
+        return RedisVersions(REDIS_URL)
+    return MemoryVersions()
+
+resource_versions = create_resource_versions()
+
+async def documents_changed(*document_ids: int):
+    """Call after committing document changes: invalidates the lists and those documents."""
+    await resource_versions.bump("documents", *[f"document:{doc_id}" for doc_id in document_ids])
+
+class ResponseCache:
+    """LRU of serialized JSON bodies keyed by ETag, bounded by their total size in bytes.
+
+    ETags embed the resource versions, so entries never go stale; old ones just age out.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[bytes, dict]]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, etag: str) -> Optional[Tuple[bytes, dict]]:
+        if self.max_bytes <= 0:
+            return None
+        entry = self._entries.get(etag)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(etag)
+        self.hits += 1
+        return entry
+
+    def put(self, etag: str, body: bytes, headers: dict):
+        # a body bigger than a quarter of the budget would flush most of the cache for one page
+        if self.max_bytes <= 0 or len(body) > self.max_bytes // 4 or etag in self._entries:
+            return
+        self._entries[etag] = (body, headers)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, (old_body, _) = self._entries.popitem(last=False)
+            self.size -= len(old_body)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+response_cache = ResponseCache(RESPONSE_CACHE_BYTES)
+
+async def conditional_json(request: Request, user: "User", keys: List[str], build) -> Response:
+    """JSON response with a weak ETag derived from the versions of keys.
+
+    build() -> (content, headers) only runs when the client's If-None-Match is
+    stale and the body is not in response_cache, so a 304 costs no query.
+    The ETag covers the viewer's scope (admin, or the user id) and the query string.
+    """
+    scope = "admin" if user.role == "admin" else f"user:{user.id}"
+    variant = json.dumps([scope, request.url.path, sorted(request.query_params.multi_items())])
+    version = await resource_versions.current(*keys)
+    tag = f'"{version}-{hashlib.blake2b(variant.encode(), digest_size=8).hexdigest()}"'
+    etag = f"W/{tag}"
+    cache_control = f"private, max-age={RESPONSE_MAX_AGE}" if RESPONSE_MAX_AGE > 0 else "private, no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Authorization"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, tag):
+        return Response(status_code=304, headers=headers)
+
+    cached = response_cache.get(etag)
+    if cached is None:
+        content, extra_headers = await build()
+        body = json.dumps(
+            jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+        response_cache.put(etag, body, extra_headers)
+        cached = (body, extra_headers)
+    body, extra_headers = cached
+    return Response(body, media_type="application/json", headers={**extra_headers, **headers})
+
+def etag_matches(header: str, etag: str) -> bool:
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
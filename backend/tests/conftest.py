@@ -0,0 +1,64 @@
+"""Settings shared by the test modules: throwaway storage, an SQLite database and fast bcrypt.
+
+The env must be set before the backend modules are imported, since they read it at import time.
+Job workers are not started by the app: job tests drive their own queues.
+"""
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/test.db")
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_tmp, "uploads"))
+os.environ.setdefault("PREVIEW_DIR", os.path.join(_tmp, "previews"))
+os.environ.setdefault("VECTOR_INDEX_DIR", os.path.join(_tmp, "vectors"))
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("RUN_JOB_WORKERS", "false")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import update  # noqa: E402
+
+import app as backend  # noqa: E402
+from database import get_engine  # noqa: E402
+from models import User  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(backend.app) as client:
+        yield client
+
+
+@pytest.fixture
+def register(client):
+    """register(role="user") -> (user id, auth headers) of a new account."""
+    def make(role: str = "user"):
+        email = f"{role}-{uuid.uuid4().hex[:12]}@example.com"
+        response = client.post("/auth/register", data={"email": email, "password": "pw", "full_name": role})
+        assert response.status_code == 200
+        user_id = response.json()["user_id"]
+        if role != "user":
+            with get_engine().begin() as conn:
+                conn.execute(update(User).where(User.id == user_id).values(role=role))
+        login = client.post("/auth/login", data={"email": email, "password": "pw", "role": role})
+        assert login.status_code == 200
+        return user_id, {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    return make
+
+
+@pytest.fixture
+def upload(client):
+    """upload(headers, content, name="note.txt") -> the created document's JSON."""
+    def make(headers, content: bytes, name: str = "note.txt"):
+        response = client.post(
+            "/documents/upload", data={"title": name}, files={"file": (name, content, "text/plain")}, headers=headers
+        )
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    return make
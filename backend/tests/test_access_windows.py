@@ -0,0 +1,75 @@
+"""Access windows compiled to per-weekday minute masks, including windows that cross midnight."""
+import time
+
+import pytest
+
+from app import FULL_DAY, AccessWindowIndex, minute_mask, parse_hhmm
+
+MONDAY, TUESDAY, SUNDAY = 0, 1, 6
+
+
+def at(weekday: int, hhmm: str) -> time.struct_time:
+    hour, minute = map(int, hhmm.split(":"))
+    return time.struct_time((2024, 1, 1 + weekday, hour, minute, 0, weekday, 1 + weekday, -1))
+
+
+def bits(mask: int):
+    return [minute for minute in range(1440) if mask >> minute & 1]
+
+
+def index_with(user_id: int, windows) -> AccessWindowIndex:
+    index = AccessWindowIndex(refresh_interval=0)
+    index._masks[user_id] = index.compile(windows)
+    index._windows[user_id] = list(windows)
+    return index
+
+
+def test_minute_mask_is_inclusive():
+    assert bits(minute_mask(0, 0)) == [0]
+    assert bits(minute_mask(540, 542)) == [540, 541, 542]
+    assert FULL_DAY == (1 << 1440) - 1
+    assert parse_hhmm("23:59") == 1439
+    with pytest.raises(ValueError):
+        parse_hhmm("24:00")
+
+
+def test_every_day_window():
+    days = AccessWindowIndex.compile([("09:00", "17:30", None)])
+    assert all(bits(day) == list(range(540, 1051)) for day in days)
+
+
+def test_midnight_wrap_continues_next_day():
+    days = AccessWindowIndex.compile([("22:00", "02:00", MONDAY), ("23:30", "00:15", SUNDAY)])
+    assert bits(days[MONDAY]) == list(range(0, 16)) + list(range(1320, 1440))
+    assert bits(days[TUESDAY]) == list(range(0, 121))
+    assert bits(days[SUNDAY]) == list(range(1410, 1440))
+    assert all(days[day] == 0 for day in range(2, 6))
+
+
+def test_invalid_windows_are_ignored():
+    assert AccessWindowIndex.compile([("9h", "17:00", None), ("08:00", "08:00", TUESDAY)]) == (
+        0, minute_mask(480, 480), 0, 0, 0, 0, 0
+    )
+
+
+def test_allowed_checks_weekday_and_minute():
+    index = index_with(1, [("09:00", "12:00", MONDAY), ("22:00", "01:00", TUESDAY)])
+    assert index.allowed(1, at(MONDAY, "09:00"))
+    assert index.allowed(1, at(MONDAY, "12:00"))
+    assert not index.allowed(1, at(MONDAY, "12:01"))
+    assert not index.allowed(1, at(TUESDAY, "09:30"))
+    assert index.allowed(1, at(TUESDAY, "23:00"))
+    assert index.allowed(1, at(2, "00:59"))
+    assert not index.allowed(1, at(2, "01:01"))
+    # users without windows are unrestricted
+    assert index.allowed(2, at(SUNDAY, "03:00"))
+    assert not index.has_windows(2)
+
+
+def test_window_for_reports_the_admitting_window():
+    index = index_with(1, [("08:00", "10:00", None), ("20:00", "02:00", SUNDAY)])
+    assert index.window_for(1, at(MONDAY, "01:00")) == ("20:00", "02:00")
+    assert index.window_for(1, at(MONDAY, "09:00")) == ("08:00", "10:00")
+    # outside every window: the first one is shown
+    assert index.window_for(1, at(MONDAY, "15:00")) == ("08:00", "10:00")
+    assert index.window_for(2, at(MONDAY, "15:00")) is None
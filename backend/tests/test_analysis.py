@@ -0,0 +1,40 @@
+"""Map-reduce helpers: chunking long texts and merging the keywords found in each chunk."""
+from analysis import estimate_tokens, merge_keywords, split_into_chunks
+
+
+def test_short_text_is_one_chunk():
+    assert split_into_chunks("") == []
+    assert split_into_chunks("  un   texte\ncourt ", max_tokens=100, overlap_tokens=10) == ["un texte court"]
+
+
+def test_chunks_respect_budget_and_overlap():
+    words = [f"w{i:04d}" for i in range(103)]  # 2 tokens each
+    chunks = [chunk.split() for chunk in split_into_chunks(" ".join(words), max_tokens=10, overlap_tokens=4)]
+
+    assert all(sum(estimate_tokens(w) for w in chunk) <= 10 for chunk in chunks)
+    assert chunks[0][0] == words[0] and chunks[-1][-1] == words[-1]
+    for previous, current in zip(chunks, chunks[1:]):
+        assert previous[-2:] == current[:2]
+    # overlaps aside, every word appears once and in order
+    rebuilt = chunks[0] + [w for chunk in chunks[1:] for w in chunk[2:]]
+    assert rebuilt == words
+
+
+def test_oversized_words_and_overlaps_still_progress():
+    assert split_into_chunks("x" * 100 + " court", max_tokens=5, overlap_tokens=0) == ["x" * 100, "court"]
+    # an overlap as large as the chunk would repeat it forever without the one-word advance
+    chunks = split_into_chunks("a b c d e f", max_tokens=2, overlap_tokens=10)
+    assert chunks == ["a b", "b c", "c d", "d e", "e f"]
+
+
+def test_merge_keywords_ranks_by_chunk_count():
+    merged = merge_keywords(
+        ["contrat, Bail, loyer.", "bail, garantie", None, "Loyer, bail,  , caution"],
+        limit=3,
+    )
+    assert merged == "Bail, loyer, contrat"
+
+
+def test_merge_keywords_limit_and_empty():
+    assert merge_keywords([]) == ""
+    assert merge_keywords(["a, b, c, d"], limit=2) == "a, b"
@@ -0,0 +1,29 @@
+"""Tokens minted by /auth/login must authenticate the following requests."""
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/test.db")
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_tmp, "uploads"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import app as backend  # noqa: E402
+
+
+def test_login_token_authenticates_me():
+    with TestClient(backend.app) as client:
+        registered = client.post(
+            "/auth/register", data={"email": "me@example.com", "password": "pw", "full_name": "Me"}
+        )
+        assert registered.status_code == 200
+
+        login = client.post("/auth/login", data={"email": "me@example.com", "password": "pw", "role": "user"})
+        assert login.status_code == 200
+        token = login.json()["access_token"]
+
+        me = client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+        assert me.status_code == 200
+        assert me.json()["email"] == "me@example.com"
@@ -0,0 +1,51 @@
+"""Blob store: identical uploads share one reference-counted file, reaped with its last document."""
+import hashlib
+import os
+import uuid
+
+from sqlalchemy import select
+
+from config import UPLOAD_DIR
+from database import get_engine
+from models import Blob
+
+
+def blob_row(sha256: str):
+    with get_engine().connect() as conn:
+        return conn.execute(select(Blob.file_path, Blob.ref_count).where(Blob.sha256 == sha256)).first()
+
+
+def test_identical_uploads_share_one_blob(register, upload):
+    _, headers = register()
+    content = f"same content {uuid.uuid4()}".encode()
+    first = upload(headers, content)
+    second = upload(headers, content, name="copy.txt")
+
+    assert first["sha256"] == second["sha256"] == hashlib.sha256(content).hexdigest()
+    assert (first["deduplicated"], second["deduplicated"]) == (False, True)
+    row = blob_row(first["sha256"])
+    assert row.ref_count == 2
+    with open(os.path.join(UPLOAD_DIR, row.file_path), "rb") as f:
+        assert f.read() == content
+
+
+def test_blob_is_reaped_with_its_last_document(client, register, upload):
+    _, headers = register()
+    content = f"shared {uuid.uuid4()}".encode()
+    first = upload(headers, content)
+    second = upload(headers, content)
+    path = os.path.join(UPLOAD_DIR, blob_row(first["sha256"]).file_path)
+
+    assert client.delete(f"/documents/{first['id']}", headers=headers).status_code == 200
+    assert blob_row(first["sha256"]).ref_count == 1
+    assert os.path.exists(path)
+
+    assert client.delete(f"/documents/{second['id']}", headers=headers).status_code == 200
+    assert blob_row(first["sha256"]) is None
+    assert not os.path.exists(path)
+
+    # the same content uploaded again gets a fresh blob
+    third = upload(headers, content)
+    assert third["deduplicated"] is False
+    assert blob_row(third["sha256"]).ref_count == 1
+    assert client.get(f"/documents/{third['id']}/download", headers=headers).content == content
@@ -0,0 +1,98 @@
+"""Bulk user import: a report row per input row, windows created with their users."""
+import json
+import uuid
+
+from sqlalchemy import insert
+
+import app as backend
+from database import get_engine
+from models import User
+
+
+def import_users(client, headers, name: str, content: str, content_type: str = "text/csv"):
+    response = client.post(
+        "/users/bulk", files={"file": (name, content.encode(), content_type)}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def emails(count: int):
+    tag = uuid.uuid4().hex[:8]
+    return [f"import-{tag}-{i}@example.com" for i in range(count)]
+
+
+def test_csv_report_rows(client, register):
+    _, root = register("admin")
+    new, plain, admin, bad_role, no_password, bad_window = emails(6)
+    existing = f"existing-{uuid.uuid4().hex[:8]}@example.com"
+    client.post("/auth/register", data={"email": existing, "password": "pw", "full_name": "x"})
+    csv_file = "\n".join([
+        "email,password,full_name,role,windows",
+        f"{new},pw,New,,08:00-12:00@0;22:00-02:00",
+        f"{plain},pw,Plain,user,",
+        f"{admin},pw,Admin,admin,",
+        f"{existing},pw,Existing,,",
+        f"{bad_role},pw,Bad role,owner,",
+        f"{no_password},,No password,,",
+        f"{bad_window},pw,Bad window,,25:00-26:00",
+        f"{plain},pw,Plain again,,",
+    ])
+    report = import_users(client, root, "users.csv", csv_file)
+
+    assert (report["total"], report["created"], report["existing"], report["failed"]) == (8, 3, 1, 4)
+    items = report["items"]
+    assert [item["row"] for item in items] == list(range(1, 9))
+    assert [item["status"] for item in items] == [
+        "created", "created", "created", "exists", "error", "error", "error", "error"
+    ]
+    assert items[4]["detail"] == "role must be user or admin"
+    assert items[5]["detail"] == "email and password are required"
+    assert "Invalid time" in items[6]["detail"]
+    assert items[7]["detail"] == "Duplicate email in file"
+
+    windows = client.get(f"/access-windows/{items[0]['id']}", headers=root).json()["windows"]
+    assert [(w["start_time"], w["end_time"], w["weekday"]) for w in windows] == [
+        ("08:00", "12:00", 0), ("22:00", "02:00", None)
+    ]
+    login = client.post("/auth/login", data={"email": admin, "password": "pw", "role": "admin"})
+    assert login.status_code == 200
+
+
+def test_json_import_validates_fields(client, register):
+    _, root = register("admin")
+    ok, bad = emails(2)
+    report = import_users(client, root, "users.json", json.dumps({"users": [
+        {"email": ok, "password": "pw", "windows": [{"start_time": "09:00", "end_time": "17:00", "weekday": 4}]},
+        {"email": bad, "password": "pw", "windows": [{"start_time": "09:00"}]},
+    ]}), "application/json")
+    assert [item["status"] for item in report["items"]] == ["created", "error"]
+    assert report["items"][1]["detail"].startswith("windows.0.end_time")
+
+
+def test_email_taken_during_import_fails_only_its_row(client, register, monkeypatch):
+    _, root = register("admin")
+    first, raced, last = emails(3)
+    hash_passwords = backend.hash_passwords
+
+    def register_meanwhile(passwords):
+        # the email is registered after the existence check, before the batch insert
+        with get_engine().begin() as conn:
+            conn.execute(insert(User).values(email=raced, hashed_password="x", role="user"))
+        return hash_passwords(passwords)
+
+    monkeypatch.setattr(backend, "hash_passwords", register_meanwhile)
+    csv_file = "email,password\n" + "\n".join(f"{email},pw" for email in (first, raced, last))
+    report = import_users(client, root, "users.csv", csv_file)
+
+    assert [item["status"] for item in report["items"]] == ["created", "exists", "created"]
+    assert report["created"] == 2 and report["existing"] == 1
+
+
+def test_import_requires_admin(client, register):
+    _, headers = register()
+    response = client.post("/users/bulk", files={"file": ("u.csv", b"email,password\n", "text/csv")}, headers=headers)
+    assert response.status_code == 403
+    _, root = register("admin")
+    response = client.post("/users/bulk", files={"file": ("u.json", b"{", "application/json")}, headers=root)
+    assert response.status_code == 400
@@ -0,0 +1,71 @@
+"""Bulk upload: plain files and ZIP members reported one by one, bad files failing alone."""
+import io
+import uuid
+import zipfile
+
+import app as backend
+
+
+def zip_bytes(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def bulk_upload(client, headers, files, **data):
+    response = client.post(
+        "/documents/bulk-upload",
+        files=[("files", (name, content, "application/octet-stream")) for name, content in files],
+        data=data,
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_report_covers_files_and_archive_members(client, register):
+    _, headers = register()
+    unique = uuid.uuid4().hex.encode()
+    archive = zip_bytes({
+        "scans/": b"",
+        "scans/invoice.txt": b"invoice " + unique,
+        "letter.txt": b"same " + unique,
+        "__MACOSX/._letter.txt": b"resource fork",
+    })
+    report = bulk_upload(client, headers, [
+        ("notes.txt", b"same " + unique),
+        ("batch.zip", archive),
+        ("broken.zip", b"not a zip"),
+    ])
+
+    assert (report["total"], report["succeeded"], report["failed"]) == (4, 3, 1)
+    assert report["bytes"] == 2 * len(b"same " + unique) + len(b"invoice " + unique)
+    by_name = {item["filename"]: item for item in report["items"]}
+    assert list(by_name) == ["notes.txt", "batch.zip/scans/invoice.txt", "batch.zip/letter.txt", "broken.zip"]
+    assert by_name["broken.zip"] == {"filename": "broken.zip", "status": "error", "detail": "Invalid ZIP archive"}
+
+    notes, letter = by_name["notes.txt"], by_name["batch.zip/letter.txt"]
+    assert (notes["deduplicated"], letter["deduplicated"]) == (False, True)
+    assert notes["sha256"] == letter["sha256"]
+    assert by_name["batch.zip/scans/invoice.txt"]["title"] == "invoice"
+
+    listed = {doc["id"] for doc in client.get("/documents", headers=headers).json()}
+    assert listed == {item["id"] for item in report["items"] if item["status"] == "ok"}
+    download = client.get(f"/documents/{letter['id']}/download", headers=headers)
+    assert download.content == b"same " + unique
+
+
+def test_analyze_queues_a_job_per_document(client, register):
+    _, headers = register()
+    report = bulk_upload(client, headers, [("a.txt", uuid.uuid4().bytes)], analyze="true")
+    assert report["items"][0]["job_id"]
+
+
+def test_files_over_the_limit_fail_individually(client, register, monkeypatch):
+    monkeypatch.setattr(backend, "BULK_MAX_FILES", 2)
+    _, headers = register()
+    report = bulk_upload(client, headers, [(f"{i}.txt", uuid.uuid4().bytes) for i in range(3)])
+    assert [item["status"] for item in report["items"]] == ["ok", "ok", "error"]
+    assert "max 2" in report["items"][2]["detail"]
@@ -0,0 +1,59 @@
+"""Keyset pagination of GET /documents: cursor encoding and page boundaries."""
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 3, 1, 12, 30, 5, 123456)
+    cursor = encode_cursor(created_at, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, 42)
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor(datetime(2024, 1, 1), 1)[:-3], "W10"])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as excinfo:
+        decode_cursor(cursor)
+    assert excinfo.value.status_code == 400
+
+
+def test_pages_cover_every_document_once(client, register, upload):
+    _, headers = register()
+    # uploads in the same request burst often share created_at; the id breaks the tie
+    ids = [upload(headers, f"page {i}".encode(), name=f"doc{i}.txt")["id"] for i in range(7)]
+
+    seen, cursors = [], []
+    params = {"limit": 3, "fields": "id"}
+    while True:
+        response = client.get("/documents", params=params, headers=headers)
+        assert response.status_code == 200
+        assert response.headers["X-Total-Count"] == "7"
+        page = [item["id"] for item in response.json()]
+        assert 0 < len(page) <= 3
+        seen.extend(page)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        cursors.append(cursor)
+        params["cursor"] = cursor
+
+    assert len(cursors) == 2
+    assert seen == sorted(ids, reverse=True)
+
+
+def test_exact_multiple_has_no_trailing_cursor(client, register, upload):
+    _, headers = register()
+    for i in range(4):
+        upload(headers, f"even {i}".encode())
+
+    first = client.get("/documents", params={"limit": 2}, headers=headers)
+    second = client.get(
+        "/documents", params={"limit": 2, "cursor": first.headers["X-Next-Cursor"]}, headers=headers
+    )
+    assert len(second.json()) == 2
+    assert "X-Next-Cursor" not in second.headers
+    assert client.get("/documents", params={"cursor": "garbage"}, headers=headers).status_code == 400
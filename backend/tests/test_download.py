@@ -0,0 +1,91 @@
+"""Downloads: single byte ranges, 416 for unsatisfiable ranges and conditional requests on the ETag."""
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from app import parse_byte_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=10-", (10, 99)),
+    ("bytes=90-500", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("Bytes = 5-5", (5, 5)),
+    # served whole: other units, multiple ranges, garbage
+    ("items=0-9", None),
+    ("bytes=0-9,20-29", None),
+    ("bytes=abc", None),
+    ("bytes=-0", None),
+])
+def test_parse_byte_range(header, expected):
+    assert parse_byte_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=200-300", "bytes=9-3"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(HTTPException) as excinfo:
+        parse_byte_range(header, 100)
+    assert excinfo.value.status_code == 416
+    assert excinfo.value.headers["Content-Range"] == "bytes */100"
+
+
+@pytest.fixture
+def document(register, upload):
+    _, headers = register()
+    content = f"{uuid.uuid4().hex}0123456789".encode()
+    doc = upload(headers, content)
+    return f"/documents/{doc['id']}/download", headers, content
+
+
+def test_full_download(client, document):
+    url, headers, content = document
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["Content-Length"] == str(len(content))
+
+
+def test_partial_download(client, document):
+    url, headers, content = document
+    response = client.get(url, headers={**headers, "Range": "bytes=2-11"})
+    assert response.status_code == 206
+    assert response.content == content[2:12]
+    assert response.headers["Content-Range"] == f"bytes 2-11/{len(content)}"
+
+    tail = client.get(url, headers={**headers, "Range": "bytes=-10"})
+    assert tail.status_code == 206 and tail.content == b"0123456789"
+
+
+def test_range_past_the_end(client, document):
+    url, headers, content = document
+    response = client.get(url, headers={**headers, "Range": f"bytes={len(content)}-"})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{len(content)}"
+
+
+def test_conditional_requests(client, document):
+    url, headers, content = document
+    etag = client.get(url, headers=headers).headers["ETag"]
+    assert not etag.startswith("W/")
+
+    not_modified = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert not_modified.status_code == 304 and not_modified.content == b""
+    assert client.get(url, headers={**headers, "If-None-Match": '"other"'}).status_code == 200
+
+    # If-Range: the range applies only while the ETag still matches
+    current = client.get(url, headers={**headers, "Range": "bytes=0-3", "If-Range": etag})
+    assert current.status_code == 206 and current.content == content[:4]
+    stale = client.get(url, headers={**headers, "Range": "bytes=0-3", "If-Range": '"stale"'})
+    assert stale.status_code == 200 and stale.content == content
+
+
+def test_head_sends_headers_only(client, document):
+    url, headers, content = document
+    response = client.head(url, headers={**headers, "Range": "bytes=0-4"})
+    assert response.status_code == 206
+    assert response.headers["Content-Length"] == "5"
+    assert response.content == b""
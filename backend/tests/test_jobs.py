@@ -0,0 +1,205 @@
+"""Job queues: reservation, retries with backoff, lease expiry and workers outliving queue errors."""
+import asyncio
+import time
+
+import pytest
+
+import jobs
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_RETRY_BACKOFF", 0.05)
+    monkeypatch.setattr(jobs, "JOB_QUEUE_RETRY_MAX", 0.01)
+
+
+@pytest.fixture
+def redis_queue():
+    fakeredis = pytest.importorskip("fakeredis")
+    queue = jobs.RedisJobQueue("redis://localhost:6379/0")
+    queue.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    return queue
+
+
+def test_memory_reserve_marks_job_running():
+    async def scenario():
+        queue = jobs.MemoryJobQueue()
+        job = await queue.enqueue("analyze_document", {"document_id": 1}, dedupe_key="analyze:1")
+        duplicate = await queue.enqueue("analyze_document", {"document_id": 1}, dedupe_key="analyze:1")
+        assert duplicate["id"] == job["id"]
+
+        reserved = await queue.reserve(timeout=0.1)
+        assert reserved["id"] == job["id"]
+        assert reserved["status"] == jobs.JOB_RUNNING
+        assert reserved["attempts"] == 1
+        assert await queue.reserve(timeout=0.05) is None
+
+        await queue.complete(reserved, {"ok": True})
+        assert (await queue.get(job["id"]))["status"] == jobs.JOB_SUCCEEDED
+        # a finished job no longer swallows new requests with its dedupe key
+        again = await queue.enqueue("analyze_document", {"document_id": 1}, dedupe_key="analyze:1")
+        assert again["id"] != job["id"]
+
+    asyncio.run(scenario())
+
+
+def test_memory_retries_until_max_attempts():
+    async def scenario():
+        queue = jobs.MemoryJobQueue()
+        job = await queue.enqueue("analyze_document", {})
+        for attempt in range(1, job["max_attempts"] + 1):
+            reserved = await queue.reserve(timeout=1.0)
+            assert reserved is not None and reserved["attempts"] == attempt
+            await queue.fail(reserved, "boom")
+        assert job["status"] == jobs.JOB_FAILED
+        assert job["error"] == "boom"
+        assert await queue.reserve(timeout=0.2) is None
+
+    asyncio.run(scenario())
+
+
+def test_memory_permanent_failure_is_not_retried():
+    async def scenario():
+        queue = jobs.MemoryJobQueue()
+        job = await queue.enqueue("analyze_document", {})
+        await queue.fail(await queue.reserve(timeout=0.1), "gone", retry=False)
+        assert job["status"] == jobs.JOB_FAILED
+        assert await queue.reserve(timeout=0.2) is None
+
+    asyncio.run(scenario())
+
+
+def test_redis_reserve_leases_job(redis_queue):
+    async def scenario():
+        job = await redis_queue.enqueue("analyze_document", {"document_id": 7})
+        reserved = await redis_queue.reserve(timeout=0.1)
+        assert reserved["id"] == job["id"]
+        assert reserved["status"] == jobs.JOB_RUNNING and reserved["attempts"] == 1
+        assert await redis_queue.redis.lrange(redis_queue.processing_key, 0, -1) == [job["id"]]
+        assert await redis_queue.redis.zscore(redis_queue.leases_key, job["id"]) > time.time()
+
+        await redis_queue.complete(reserved, {"summary": "ok"})
+        stored = await redis_queue.get(job["id"])
+        assert stored["status"] == jobs.JOB_SUCCEEDED and stored["result"] == {"summary": "ok"}
+        assert await redis_queue.redis.llen(redis_queue.processing_key) == 0
+        assert await redis_queue.redis.zcard(redis_queue.leases_key) == 0
+
+    asyncio.run(scenario())
+
+
+def test_redis_requeues_job_whose_lease_lapsed(redis_queue, monkeypatch):
+    async def scenario():
+        job = await redis_queue.enqueue("analyze_document", {})
+        monkeypatch.setattr(jobs, "JOB_LEASE_TIMEOUT", 0.05)
+        await redis_queue.reserve(timeout=0.1)
+        # the lease is still live: recover() leaves the job to its worker
+        await redis_queue.recover()
+        assert await redis_queue.redis.llen(redis_queue.ready_key) == 0
+
+        await asyncio.sleep(0.1)
+        await redis_queue.recover()
+        assert await redis_queue.redis.lrange(redis_queue.ready_key, 0, -1) == [job["id"]]
+        assert await redis_queue.redis.llen(redis_queue.processing_key) == 0
+
+        monkeypatch.setattr(jobs, "JOB_LEASE_TIMEOUT", 60)
+        reserved = await redis_queue.reserve(timeout=0.1)
+        assert reserved["id"] == job["id"] and reserved["attempts"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_redis_recover_leases_unleased_processing_jobs(redis_queue, monkeypatch):
+    async def scenario():
+        # a worker that died between BLMOVE and ZADD leaves the job in processing without a lease
+        job = await redis_queue.enqueue("analyze_document", {})
+        await redis_queue.redis.lmove(redis_queue.ready_key, redis_queue.processing_key, "RIGHT", "LEFT")
+        await redis_queue.recover()
+        assert await redis_queue.redis.zscore(redis_queue.leases_key, job["id"]) is not None
+        assert await redis_queue.redis.llen(redis_queue.ready_key) == 0
+
+    asyncio.run(scenario())
+
+
+def test_redis_retries_with_backoff_then_fails(redis_queue):
+    async def scenario():
+        job = await redis_queue.enqueue("analyze_document", {}, dedupe_key="analyze:9")
+        reserved = await redis_queue.reserve(timeout=0.1)
+        await redis_queue.fail(reserved, "ollama down")
+        assert (await redis_queue.get(job["id"]))["status"] == jobs.JOB_QUEUED
+        assert await redis_queue.redis.zcard(redis_queue.delayed_key) == 1
+        # not due yet
+        assert await redis_queue.reserve(timeout=0.01) is None
+
+        for attempt in range(2, job["max_attempts"] + 1):
+            await asyncio.sleep(jobs.retry_delay(attempt - 1) + 0.02)
+            reserved = await redis_queue.reserve(timeout=0.1)
+            assert reserved["attempts"] == attempt
+            await redis_queue.fail(reserved, "ollama down")
+
+        stored = await redis_queue.get(job["id"])
+        assert stored["status"] == jobs.JOB_FAILED and stored["error"] == "ollama down"
+        assert await redis_queue.redis.zcard(redis_queue.delayed_key) == 0
+        assert await redis_queue.redis.get(redis_queue.dedupe_key("analyze:9")) is None
+
+    asyncio.run(scenario())
+
+
+def test_run_job_records_handler_outcomes(monkeypatch):
+    async def ok(payload):
+        return {"echo": payload["value"]}
+
+    async def broken(payload):
+        raise jobs.PermanentJobError("no such document")
+
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "test_ok", ok)
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "test_broken", broken)
+
+    async def scenario():
+        queue = jobs.MemoryJobQueue()
+        done = await queue.enqueue("test_ok", {"value": 3})
+        failed = await queue.enqueue("test_broken", {})
+        unknown = await queue.enqueue("test_unknown", {})
+        for _ in range(3):
+            await jobs.run_job(queue, await queue.reserve(timeout=0.1))
+        assert done["status"] == jobs.JOB_SUCCEEDED and done["result"] == {"echo": 3}
+        assert failed["status"] == jobs.JOB_FAILED and failed["attempts"] == 1
+        assert unknown["status"] == jobs.JOB_FAILED and "Unknown job kind" in unknown["error"]
+
+    asyncio.run(scenario())
+
+
+class FlakyQueue(jobs.MemoryJobQueue):
+    """Memory queue whose first reservations fail like an unreachable Redis."""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    async def reserve(self, timeout: float = 1.0):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Connection refused")
+        return await super().reserve(timeout)
+
+
+def test_worker_survives_queue_errors(monkeypatch):
+    async def ok(payload):
+        return {}
+
+    monkeypatch.setitem(jobs.JOB_HANDLERS, "test_ok", ok)
+
+    async def scenario():
+        queue = FlakyQueue(failures=3)
+        job = await queue.enqueue("test_ok", {})
+        stop = asyncio.Event()
+        worker = asyncio.create_task(jobs.job_worker_loop(queue, stop))
+        for _ in range(100):
+            if job["status"] == jobs.JOB_SUCCEEDED:
+                break
+            await asyncio.sleep(0.02)
+        stop.set()
+        await asyncio.wait_for(worker, 2)
+        assert job["status"] == jobs.JOB_SUCCEEDED
+        assert queue.failures == 0
+
+    asyncio.run(scenario())
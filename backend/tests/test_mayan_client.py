@@ -0,0 +1,122 @@
+"""MayanClient against the benchmark's fake Mayan server: uploads, adaptive concurrency and backoff."""
+import asyncio
+
+import httpx
+import pytest
+
+from bench import fake_mayan
+from mayan import MayanClient, mayan_retriable
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "scan.pdf"
+    path.write_bytes(b"%PDF-1.4 fake scan")
+    return str(path)
+
+
+@pytest.fixture
+def server():
+    servers = []
+
+    def start(**options):
+        srv, stats = fake_mayan.start(token="test-token", **options)
+        servers.append(srv)
+        return f"http://127.0.0.1:{srv.server_address[1]}", stats
+
+    yield start
+    for srv in servers:
+        srv.shutdown()
+        srv.server_close()
+
+
+def run(base_url: str, scenario, token: str = "test-token", max_concurrency: int = 3, slow_seconds: float = 5):
+    async def main():
+        client = MayanClient(base_url, token, "", "", timeout=5, max_concurrency=max_concurrency, slow_seconds=slow_seconds)
+        try:
+            return await scenario(client)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(main())
+
+
+def test_upload_returns_the_mayan_id(server, source):
+    base_url, stats = server(latency=0)
+
+    async def scenario(client):
+        mayan_id = await client.upload(source, "scan.pdf", "Quittance", "mars")
+        document = (await client.client.get(f"/api/v4/documents/{mayan_id}/")).json()
+        return mayan_id, document
+
+    mayan_id, document = run(base_url, scenario)
+    assert mayan_id == "1"
+    assert document["label"] == "Quittance"
+    assert stats["uploads"] == 1
+
+
+def test_concurrency_ramps_up_to_the_maximum(server, source):
+    base_url, stats = server(latency=0.02)
+
+    async def scenario(client):
+        ids = await asyncio.gather(*[client.upload(source, "scan.pdf", f"doc {i}") for i in range(12)])
+        assert sorted(ids, key=int) == [str(i) for i in range(1, 13)]
+        return client.stats()
+
+    client_stats = run(base_url, scenario)
+    assert client_stats["concurrency_limit"] == 3
+    assert (client_stats["calls"], client_stats["errors"], client_stats["in_flight"]) == (12, 0, 0)
+    assert 1 < stats["max_in_flight"] <= 3
+
+
+def test_slow_uploads_keep_one_slot(server, source):
+    base_url, stats = server(latency=0.02)
+
+    async def scenario(client):
+        await asyncio.gather(*[client.upload(source, "scan.pdf", f"doc {i}") for i in range(4)])
+        return client.limit
+
+    assert run(base_url, scenario, slow_seconds=0.01) == 1
+    assert stats["max_in_flight"] == 1
+
+
+def test_overload_halves_the_limit_and_honors_retry_after(server, source):
+    base_url, stats = server(latency=0, fail_rate=1.0)
+
+    async def scenario(client):
+        client.limit = 3.0
+        with pytest.raises(httpx.HTTPStatusError) as excinfo:
+            await client.upload(source, "scan.pdf", "refused")
+        assert mayan_retriable(excinfo.value)
+        return client.stats()
+
+    client_stats = run(base_url, scenario)
+    assert client_stats["concurrency_limit"] == 1
+    assert client_stats["errors"] == 1
+    assert 0 < client_stats["paused_for"] <= 1
+    assert stats["rejected"] == 1
+
+
+def test_rejected_token_is_not_retriable(server, source):
+    base_url, stats = server(latency=0)
+
+    async def scenario(client):
+        with pytest.raises(httpx.HTTPStatusError) as excinfo:
+            await client.upload(source, "scan.pdf", "denied")
+        assert excinfo.value.response.status_code == 401
+        assert not mayan_retriable(excinfo.value)
+
+    run(base_url, scenario, token="wrong")
+    assert "uploads" not in stats
+
+
+def test_unreachable_server_is_retriable(source):
+    async def scenario(client):
+        client.limit = 2.0
+        with pytest.raises(httpx.TransportError) as excinfo:
+            await client.upload(source, "scan.pdf", "offline")
+        assert mayan_retriable(excinfo.value)
+        return client.limit
+
+    assert run("http://127.0.0.1:9", scenario) == 1
+    assert not mayan_retriable(ValueError("Mayan response has no document id"))
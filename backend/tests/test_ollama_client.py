@@ -0,0 +1,84 @@
+"""OllamaClient against the benchmark's fake Ollama server."""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from bench import fake_ollama
+from ollama_client import OllamaClient
+
+
+@pytest.fixture(scope="module")
+def server():
+    srv, stats = fake_ollama.start(latency=0)
+    yield f"http://127.0.0.1:{srv.server_address[1]}", stats
+    srv.shutdown()
+    srv.server_close()
+
+
+def run(base_url: str, scenario, model: str = "mistral"):
+    async def main():
+        client = OllamaClient(base_url, model, timeout=5, max_connections=4, max_keepalive=2)
+        try:
+            return await scenario(client)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(main())
+
+
+def test_generate_records_tokens_and_latency(server):
+    base_url, stats = server
+
+    async def scenario(client):
+        data = await client.generate("Summarize: le bail est signé")
+        assert data["response"].startswith("Résumé:")
+        structured = await client.generate("Analyze this document", format="json", temperature=0)
+        assert set(json.loads(structured["response"])) == {"summary", "keywords"}
+        return client.stats(), data["prompt_eval_count"] + structured["prompt_eval_count"]
+
+    client_stats, prompt_tokens = run(base_url, scenario)
+    assert client_stats["model_ready"] and client_stats["calls"] == 2 and client_stats["errors"] == 0
+    assert client_stats["prompt_tokens"] == prompt_tokens == 8
+    assert client_stats["latency_max"] >= client_stats["latency_p50"] > 0
+    assert "/api/pull" not in stats
+
+
+def test_stream_yields_the_same_text(server):
+    base_url, _ = server
+
+    async def scenario(client):
+        whole = (await client.generate("Summarize: un deux trois"))["response"]
+        completion = client.completion_tokens
+        tokens = [token async for token in client.generate_stream("Summarize: un deux trois")]
+        assert len(tokens) > 1
+        assert "".join(tokens).strip() == whole
+        assert client.completion_tokens == 2 * completion
+
+    run(base_url, scenario)
+
+
+def test_missing_model_is_pulled_once(server):
+    base_url, stats = server
+    pulls = stats.get("/api/pull", 0)
+
+    async def scenario(client):
+        await asyncio.gather(*[client.embed(f"texte {i}", "bge-m3") for i in range(3)])
+        first = await client.embed("texte", "bge-m3")
+        assert len(first) == fake_ollama.EMBEDDING_DIM
+        assert await client.embed("texte", "nomic-embed-text") == first
+
+    run(base_url, scenario)
+    assert stats["/api/pull"] == pulls + 1
+
+
+def test_unreachable_server_counts_errors():
+    async def scenario(client):
+        client._ready_models.add(client.model)
+        with pytest.raises(httpx.ConnectError):
+            await client.generate("Summarize: rien")
+        return client.stats()
+
+    client_stats = run("http://127.0.0.1:9", scenario)
+    assert (client_stats["calls"], client_stats["errors"]) == (1, 1)
@@ -0,0 +1,81 @@
+"""Principal cache: TTL capped by the token expiry, LRU eviction and per-user invalidation."""
+import time
+
+from app import PrincipalCache
+from models import User
+
+
+def test_get_and_put():
+    cache = PrincipalCache(max_size=10, ttl=60)
+    alice = User(id=1, role="user")
+    assert cache.get("t1") is None
+    cache.put("t1", alice)
+    assert cache.get("t1") is alice
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_ttl_is_capped_by_token_expiry():
+    cache = PrincipalCache(max_size=10, ttl=60)
+    cache.put("expired", User(id=1), token_exp=time.time() - 1)
+    assert cache.get("expired") is None
+    cache.put("short", User(id=1), token_exp=time.time() + 0.05)
+    assert cache.get("short") is not None
+    time.sleep(0.1)
+    assert cache.get("short") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_lru_eviction():
+    cache = PrincipalCache(max_size=2, ttl=60)
+    cache.put("a", User(id=1))
+    cache.put("b", User(id=2))
+    cache.get("a")
+    cache.put("c", User(id=3))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.evictions == 1
+    # evicted tokens leave the per-user index too
+    assert 2 not in cache._tokens_by_user
+
+
+def test_invalidate_user_drops_all_their_tokens():
+    cache = PrincipalCache(max_size=10, ttl=60)
+    cache.put("a1", User(id=1))
+    cache.put("a2", User(id=1))
+    cache.put("b1", User(id=2))
+    cache.invalidate_user(1)
+    assert cache.get("a1") is None and cache.get("a2") is None
+    assert cache.get("b1") is not None
+    assert cache.invalidations == 2
+
+
+def test_disabled_cache():
+    cache = PrincipalCache(max_size=0, ttl=60)
+    assert not cache.enabled
+    cache.put("a", User(id=1))
+    assert cache.get("a") is None
+
+
+def test_demoted_admin_loses_access_immediately(client, register):
+    _, root = register("admin")
+    admin_id, admin = register("admin")
+    # a first request caches the admin principal
+    hits = client.get("/auth/principal-cache", headers=admin).json()["hits"]
+    assert client.get("/auth/principal-cache", headers=admin).json()["hits"] == hits + 1
+
+    assert client.patch(f"/users/{admin_id}", data={"role": "user"}, headers=root).status_code == 200
+    assert client.get("/auth/principal-cache", headers=admin).status_code == 403
+
+
+def test_deactivated_and_deleted_users_are_rejected(client, register):
+    _, root = register("admin")
+    user_id, headers = register()
+    assert client.get("/documents", headers=headers).status_code == 200
+
+    assert client.patch(f"/users/{user_id}", data={"is_active": "false"}, headers=root).status_code == 200
+    assert client.get("/documents", headers=headers).status_code == 401
+
+    other_id, other = register()
+    assert client.get("/documents", headers=other).status_code == 200
+    assert client.delete(f"/users/{other_id}", headers=root).status_code == 200
+    assert client.get("/documents", headers=other).status_code == 401
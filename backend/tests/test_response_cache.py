@@ -0,0 +1,114 @@
+"""Weak ETags from resource versions, 304s, invalidation on writes and the byte-bounded body cache."""
+import asyncio
+
+import pytest
+
+import response_cache
+from response_cache import MemoryVersions, RedisVersions, ResponseCache, etag_matches
+
+
+def test_etag_matches():
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches('"a"', '"a"')
+    assert etag_matches("*", '"a"')
+    assert not etag_matches('"ab"', '"a"')
+
+
+def test_memory_versions_bump_only_their_keys():
+    async def scenario():
+        versions = MemoryVersions()
+        before = await versions.current("documents", "document:1")
+        await versions.bump("document:2")
+        assert await versions.current("documents", "document:1") == before
+        await versions.bump("document:1")
+        assert await versions.current("documents", "document:1") != before
+        # another process (or a restart) never reproduces the same tags
+        assert await MemoryVersions().current("documents") != await versions.current("documents")
+
+    asyncio.run(scenario())
+
+
+def test_redis_versions_survive_until_flushed():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        versions = RedisVersions("redis://localhost:6379/0")
+        versions.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        first = await versions.current("documents")
+        await versions.bump("documents")
+        second = await versions.current("documents")
+        assert first != second and first.split(".")[0] == second.split(".")[0]
+        await versions.redis.flushall()
+        assert await versions.current("documents") != first
+
+    asyncio.run(scenario())
+
+
+def test_response_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_bytes=40)
+    cache.put("a", b"x" * 10, {})
+    cache.put("b", b"x" * 10, {})
+    cache.put("c", b"x" * 10, {})
+    assert cache.get("a") == (b"x" * 10, {})
+    cache.put("d", b"x" * 10, {})
+    cache.put("e", b"x" * 10, {})
+
+    assert cache.get("b") is None
+    assert [etag for etag in "acde" if cache.get(etag)] == ["a", "c", "d", "e"]
+    assert cache.size == 40 and cache.evictions == 1
+    # bodies over a quarter of the budget are not kept
+    cache.put("big", b"x" * 11, {})
+    assert cache.get("big") is None
+    assert cache.stats()["entries"] == 4
+
+
+def test_disabled_response_cache():
+    cache = ResponseCache(max_bytes=0)
+    cache.put("a", b"{}", {})
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 0
+
+
+def test_list_etag_is_reused_until_documents_change(client, register, upload):
+    _, headers = register()
+    doc = upload(headers, b"first")
+
+    first = client.get("/documents", headers=headers)
+    etag = first.headers["ETag"]
+    assert etag.startswith("W/")
+    assert client.get("/documents", headers={**headers, "If-None-Match": etag}).status_code == 304
+    # the tag covers the query string
+    assert client.get("/documents?limit=1", headers={**headers, "If-None-Match": etag}).status_code == 200
+
+    upload(headers, b"second")
+    after_upload = client.get("/documents", headers={**headers, "If-None-Match": etag})
+    assert after_upload.status_code == 200 and len(after_upload.json()) == 2
+    etag = after_upload.headers["ETag"]
+
+    assert client.delete(f"/documents/{doc['id']}", headers=headers).status_code == 200
+    after_delete = client.get("/documents", headers={**headers, "If-None-Match": etag})
+    assert after_delete.status_code == 200 and len(after_delete.json()) == 1
+
+
+def test_etag_depends_on_the_viewer(client, register):
+    _, alice = register()
+    _, bob = register()
+    etag = client.get("/documents", headers=alice).headers["ETag"]
+    assert client.get("/documents", headers={**bob, "If-None-Match": etag}).status_code == 200
+
+
+def test_cached_bodies_are_served_without_rebuilding(client, register, upload, monkeypatch):
+    cache = ResponseCache(max_bytes=1 << 20)
+    monkeypatch.setattr(response_cache, "response_cache", cache)
+    _, headers = register()
+    upload(headers, b"cached")
+
+    first = client.get("/documents", headers=headers)
+    second = client.get("/documents", headers=headers)
+    assert second.content == first.content
+    assert second.headers["X-Total-Count"] == "1"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    upload(headers, b"new version")
+    assert len(client.get("/documents", headers=headers).json()) == 2
+    assert cache.misses == 2
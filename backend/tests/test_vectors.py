@@ -0,0 +1,98 @@
+"""VectorIndex: appends, top-k search, tombstones and rebuilds that keep concurrent appends."""
+import os
+
+import numpy as np
+import pytest
+
+from vectors import VectorIndex
+
+
+def ids(results):
+    return [doc_id for doc_id, _ in results]
+
+
+@pytest.fixture
+def index(tmp_path):
+    return VectorIndex(str(tmp_path / "vectors"))
+
+
+def test_search_orders_by_cosine(index):
+    index.add(1, 10, [1, 0, 0])
+    index.add(2, 10, [1, 1, 0])
+    index.add(3, 20, [0, 0, 5])
+    query = np.array([1.0, 0.2, 0.0])
+
+    results = index.search(query, k=3)
+    assert ids(results) == [1, 2, 3]
+    assert results[0][1] == pytest.approx(1 / np.linalg.norm(query))
+    assert ids(index.search(query, k=1)) == [1]
+    assert ids(index.search(query, k=5, owner=20)) == [3]
+    assert ids(index.search(query, k=5, exclude=1)) == [2, 3]
+    assert index.search(np.array([1.0, 0.0]), k=3) == []
+
+
+def test_last_row_wins_and_tombstones(index):
+    index.add(1, 10, [1, 0])
+    index.add(2, 10, [0, 1])
+    index.add(1, 10, [0, 1])  # re-embedded
+    assert index.vector_for(1) == pytest.approx([0, 1])
+    assert sorted(ids(index.search(np.array([0.0, 1.0]), k=5))) == [1, 2]
+
+    index.remove(2)
+    index.remove(99)  # unknown ids append nothing
+    assert index.vector_for(2) is None
+    assert ids(index.search(np.array([0.0, 1.0]), k=5)) == [1]
+    assert index.stats() == {"rows": 4, "live": 1, "dim": 2}
+
+
+def test_other_processes_see_appends(index):
+    reader = VectorIndex(index.directory)
+    assert reader.search(np.array([1.0, 0.0]), k=1) == []
+    index.add(1, 10, [1, 0])
+    assert ids(reader.search(np.array([1.0, 0.0]), k=1)) == [1]
+    index.add(2, 10, [2, 0])
+    index.remove(1)
+    assert ids(reader.search(np.array([1.0, 0.0]), k=5)) == [2]
+
+
+def test_dimension_mismatch_is_rejected(index):
+    index.add(1, 10, [1, 0])
+    with pytest.raises(ValueError):
+        index.add(2, 10, [1, 0, 0])
+
+
+def test_sparse_and_dense_scans_agree(index, monkeypatch):
+    monkeypatch.setattr(VectorIndex, "SCAN_BLOCK", 7)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(100, 8))
+    for doc_id, vector in enumerate(vectors):
+        index.add(doc_id, 1 if doc_id < 3 else 2, vector.tolist())
+    query = rng.normal(size=8)
+    scores = VectorIndex.normalize(vectors) @ (query / np.linalg.norm(query))
+
+    # owner 1 is a sparse mask (gathered rows), owner 2 a dense one (block scan)
+    assert ids(index.search(query, k=2, owner=1)) == [int(i) for i in np.argsort(-scores[:3])[:2]]
+    expected = [int(i) + 3 for i in np.argsort(-scores[3:])[:5]]
+    assert ids(index.search(query, k=5, owner=2)) == expected
+
+
+def test_rebuild_replaces_rows_and_keeps_concurrent_appends(index):
+    index.add(1, 10, [1, 0])
+    index.add(2, 10, [0, 1])
+    with index.rebuilding() as append:
+        append([1, 3], [10, 10], [[1, 0], [1, 1]])
+        # a server embeds a document and deletes another while the rebuild runs
+        index.add(4, 10, [-1, 0])
+        index.remove(1)
+    assert sorted(ids(index.search(np.array([1.0, 1.0]), k=10))) == [3, 4]
+    assert index.stats()["rows"] == 4
+
+
+def test_failed_rebuild_keeps_the_live_index(index):
+    index.add(1, 10, [1, 0])
+    with pytest.raises(RuntimeError):
+        with index.rebuilding() as append:
+            append([2], [10], [[0, 1]])
+            raise RuntimeError("embedding failed")
+    assert ids(index.search(np.array([1.0, 0.0]), k=5)) == [1]
+    assert [name for name in os.listdir(index.directory) if name.endswith(".rebuild")] == []
@@ -0,0 +1,376 @@
+"""Semantic search: one embedding per analyzed document in a memory-mapped float32 matrix."""
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import NamedTuple, Optional, List, Tuple
+from contextlib import contextmanager
+import os
+import asyncio
+import json
+import fcntl
+import threading
+import numpy as np
+
+from config import EMBEDDINGS_ENABLED, EMBEDDING_MODEL, EMBED_TEXT_CHARS, UPLOAD_DIR, VECTOR_INDEX_DIR
+from database import db_session, release_connection
+from models import ANALYSIS_FAILED, Document
+from ollama_client import ollama
+from extraction import get_document_text
+
+class VectorSnapshot(NamedTuple):
+    """One consistent view of the index files; replaced as a whole, never mutated once published."""
+    signature: Optional[tuple]
+    dim: Optional[int]
+    vectors: Optional[np.ndarray]
+    ids: np.ndarray
+    owners: np.ndarray
+    live: np.ndarray
+    row_of: dict
+
+EMPTY_VECTOR_SNAPSHOT = VectorSnapshot(
+    None, None, None, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool), {}
+)
+
+class VectorIndex:
+    """Append-only, memory-mapped matrix of unit-length float32 document embeddings.
+
+    Three parallel files hold the rows: vectors.f32 (count x dim), ids.i64 and
+    owners.i64 (uploaded_by, -1 for a tombstone). The last row written for a
+    document wins, so re-embedding or deleting never rewrites earlier rows;
+    rebuild() compacts. Appends from several processes are serialized with
+    flock, and readers pick up growth by checking file sizes.
+
+    Methods run on executor threads: refresh() builds a new VectorSnapshot under
+    an RLock and swaps it in with one assignment, and readers work on the
+    snapshot they got, so a concurrent refresh never changes arrays under them.
+    """
+
+    SCAN_BLOCK = 65536
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.ids_path = os.path.join(directory, "ids.i64")
+        self.owners_path = os.path.join(directory, "owners.i64")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self._lock = threading.RLock()
+        self._state = EMPTY_VECTOR_SNAPSHOT
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._state.dim
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(os.path.join(self.directory, "lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_dim(self) -> Optional[int]:
+        if not os.path.exists(self.meta_path):
+            return None
+        with open(self.meta_path) as f:
+            return json.load(f)["dim"]
+
+    def _consistent_rows(self, dim: Optional[int]) -> int:
+        if dim is None:
+            return 0
+        sizes = [os.path.getsize(p) if os.path.exists(p) else 0 for p in (self.vectors_path, self.ids_path, self.owners_path)]
+        # a crashed writer can leave one file a row ahead of the others
+        return min(sizes[0] // (4 * dim), sizes[1] // 8, sizes[2] // 8)
+
+    def refresh(self) -> VectorSnapshot:
+        """Re-map the files if another process appended since the last call; returns the current snapshot."""
+        with self._lock:
+            dim = self._read_dim()
+            rows = self._consistent_rows(dim)
+            inode = os.stat(self.vectors_path).st_ino if os.path.exists(self.vectors_path) else None
+            signature = (dim, inode, rows)
+            previous = self._state
+            if signature == previous.signature:
+                return previous
+            if rows == 0:
+                self._state = EMPTY_VECTOR_SNAPSHOT._replace(signature=signature, dim=dim)
+            elif previous.signature is not None and previous.signature[:2] == signature[:2] and previous.signature[2] < rows:
+                self._state = self._grown(previous, signature, rows)
+            else:
+                self._state = self._loaded(signature, rows)
+            return self._state
+
+    def _grown(self, previous: VectorSnapshot, signature: tuple, rows: int) -> VectorSnapshot:
+        # same files, only grew: fold in the new rows instead of rescanning everything
+        start = previous.signature[2]
+        new_ids = np.fromfile(self.ids_path, dtype=np.int64, count=rows - start, offset=start * 8)
+        new_owners = np.fromfile(self.owners_path, dtype=np.int64, count=rows - start, offset=start * 8)
+        live = np.concatenate([previous.live, np.zeros(rows - start, dtype=bool)])
+        row_of = dict(previous.row_of)
+        for offset, (doc_id, owner) in enumerate(zip(new_ids.tolist(), new_owners.tolist())):
+            old_row = row_of.pop(doc_id, None)
+            if old_row is not None:
+                live[old_row] = False
+            if owner >= 0:
+                row_of[doc_id] = start + offset
+                live[start + offset] = True
+        return VectorSnapshot(
+            signature,
+            signature[0],
+            np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, signature[0])),
+            np.concatenate([previous.ids, new_ids]),
+            np.concatenate([previous.owners, new_owners]),
+            live,
+            row_of,
+        )
+
+    def _loaded(self, signature: tuple, rows: int) -> VectorSnapshot:
+        ids = np.fromfile(self.ids_path, dtype=np.int64, count=rows)
+        owners = np.fromfile(self.owners_path, dtype=np.int64, count=rows)
+        # index of the last row per id, found on the reversed array
+        unique_ids, first_in_reversed = np.unique(ids[::-1], return_index=True)
+        last_rows = rows - 1 - first_in_reversed
+        live = np.zeros(rows, dtype=bool)
+        live[last_rows] = True
+        live &= owners >= 0
+        live_rows = np.flatnonzero(live)
+        return VectorSnapshot(
+            signature,
+            signature[0],
+            np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, signature[0])),
+            ids,
+            owners,
+            live,
+            dict(zip(ids[live_rows].tolist(), live_rows.tolist())),
+        )
+
+    def _append_rows(self, ids: np.ndarray, owners: np.ndarray, vectors: np.ndarray):
+        with self._locked():
+            dim = self._read_dim()
+            if dim is None:
+                dim = vectors.shape[1]
+                with open(self.meta_path, "w") as f:
+                    json.dump({"dim": dim, "model": EMBEDDING_MODEL}, f)
+            if vectors.shape[1] != dim:
+                raise ValueError(f"Embedding has {vectors.shape[1]} dimensions, index expects {dim}; rebuild the index")
+            rows = self._consistent_rows(dim)
+            for path, width in ((self.vectors_path, 4 * dim), (self.ids_path, 8), (self.owners_path, 8)):
+                with open(path, "ab") as f:
+                    f.truncate(rows * width)
+            # vectors first: readers only count rows present in all three files
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.astype(np.float32).tobytes())
+            with open(self.owners_path, "ab") as f:
+                f.write(owners.astype(np.int64).tobytes())
+            with open(self.ids_path, "ab") as f:
+                f.write(ids.astype(np.int64).tobytes())
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add(self, doc_id: int, owner: int, vector: List[float]):
+        vectors = self.normalize(np.asarray([vector], dtype=np.float32))
+        self._append_rows(np.asarray([doc_id]), np.asarray([owner]), vectors)
+
+    def remove(self, doc_id: int):
+        # under the lock, so the tombstone is not skipped by a refresh racing an add of the same document
+        with self._lock:
+            state = self.refresh()
+            if doc_id in state.row_of:
+                self._append_rows(np.asarray([doc_id]), np.asarray([-1]), np.zeros((1, state.dim), dtype=np.float32))
+
+    def vector_for(self, doc_id: int) -> Optional[np.ndarray]:
+        state = self.refresh()
+        row = state.row_of.get(doc_id)
+        return None if row is None else np.asarray(state.vectors[row])
+
+    def search(self, query: np.ndarray, k: int, owner: Optional[int] = None, exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Top-k (doc_id, cosine) among live rows, restricted to owner's documents when given."""
+        state = self.refresh()
+        if state.vectors is None or query.shape[-1] != state.dim:
+            return []
+        query = self.normalize(query.reshape(1, -1).astype(np.float32))[0]
+        mask = state.live.copy()
+        if owner is not None:
+            mask &= state.owners == owner
+        if exclude is not None and exclude in state.row_of:
+            mask[state.row_of[exclude]] = False
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return []
+        k = min(k, candidates.size)
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+
+        def keep_top(rows: np.ndarray, scores: np.ndarray):
+            nonlocal best_rows, best_scores
+            rows = np.concatenate([best_rows, rows])
+            scores = np.concatenate([best_scores, scores])
+            if scores.size > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                rows, scores = rows[top], scores[top]
+            best_rows, best_scores = rows, scores
+
+        # block-wise scoring keeps peak memory bounded on large indexes; sparse masks
+        # (a user's own documents) gather their rows, dense ones scan contiguous slices
+        if candidates.size < mask.size // 20:
+            for start in range(0, candidates.size, self.SCAN_BLOCK):
+                rows = candidates[start:start + self.SCAN_BLOCK]
+                keep_top(rows, state.vectors[rows] @ query)
+        else:
+            for start in range(0, mask.size, self.SCAN_BLOCK):
+                block_mask = mask[start:start + self.SCAN_BLOCK]
+                if not block_mask.any():
+                    continue
+                scores = np.asarray(state.vectors[start:start + block_mask.size]) @ query
+                rows = np.flatnonzero(block_mask)
+                keep_top(rows + start, scores[rows])
+        order = np.argsort(-best_scores)
+        return [(int(state.ids[best_rows[i]]), float(best_scores[i])) for i in order]
+
+    @contextmanager
+    def rebuilding(self):
+        """Write a complete replacement index batch by batch, then swap it in.
+
+        Yields append(ids, owners, vectors); the staged files only replace the
+        live ones (rename per file, under the lock) if the block completes. Rows
+        that running servers appended meanwhile (new embeddings, tombstones) are
+        copied after the rebuilt ones before the swap, so they still win.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._locked():
+            start_dim = self._read_dim()
+            start_rows = self._consistent_rows(start_dim)
+            start_inode = os.stat(self.vectors_path).st_ino if start_rows else None
+        staged = {p: p + ".rebuild" for p in (self.vectors_path, self.ids_path, self.owners_path)}
+        files = {p: open(tmp, "wb") for p, tmp in staged.items()}
+        dims = []
+
+        def append(ids: List[int], owners: List[int], vectors: List[List[float]]):
+            if not ids:
+                return
+            matrix = self.normalize(np.asarray(vectors, dtype=np.float32))
+            if dims and matrix.shape[1] != dims[0]:
+                raise ValueError("Embedding dimension changed during rebuild")
+            dims[:] = [matrix.shape[1]]
+            files[self.vectors_path].write(matrix.tobytes())
+            files[self.owners_path].write(np.asarray(owners, dtype=np.int64).tobytes())
+            files[self.ids_path].write(np.asarray(ids, dtype=np.int64).tobytes())
+
+        try:
+            yield append
+            with self._locked():
+                self._replay_appends(files, dims, start_inode, start_rows)
+                for f in files.values():
+                    f.close()
+                with open(self.meta_path + ".rebuild", "w") as f:
+                    json.dump({"dim": dims[0] if dims else None, "model": EMBEDDING_MODEL}, f)
+                for final, tmp in staged.items():
+                    os.replace(tmp, final)
+                os.replace(self.meta_path + ".rebuild", self.meta_path)
+                # new inode, so the next refresh() reloads from scratch
+                self._state = EMPTY_VECTOR_SNAPSHOT
+        except BaseException:
+            for f in files.values():
+                f.close()
+            for tmp in staged.values():
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            raise
+
+    def _replay_appends(self, files: dict, dims: list, start_inode: Optional[int], start_rows: int):
+        """Copy rows appended to the live files since the rebuild started into the staged ones (under the lock)."""
+        dim = self._read_dim()
+        rows = self._consistent_rows(dim)
+        if rows == 0:
+            return
+        if os.stat(self.vectors_path).st_ino != start_inode:
+            if start_inode is not None:
+                print("Vector index was replaced during the rebuild; its newer rows are not carried over")
+                return
+            start_rows = 0
+        count = rows - start_rows
+        if count <= 0:
+            return
+        if dims and dim != dims[0]:
+            print(f"Dropping {count} embeddings added during the rebuild: {dim} dimensions, rebuilt index has {dims[0]}")
+            return
+        dims[:] = [dim]
+        files[self.vectors_path].write(
+            np.fromfile(self.vectors_path, dtype=np.float32, count=count * dim, offset=start_rows * 4 * dim).tobytes()
+        )
+        for path in (self.owners_path, self.ids_path):
+            files[path].write(np.fromfile(path, dtype=np.int64, count=count, offset=start_rows * 8).tobytes())
+
+    def stats(self) -> dict:
+        state = self.refresh()
+        return {"rows": int(state.ids.size), "live": int(state.live.sum()), "dim": state.dim}
+
+vector_index = VectorIndex(VECTOR_INDEX_DIR)
+
+def embedding_text(doc: Document, text: str) -> str:
+    parts = [doc.title or "", doc.ai_summary or "", doc.ai_keywords or "", text[:EMBED_TEXT_CHARS]]
+    return "\n".join(p for p in parts if p and p != ANALYSIS_FAILED)
+
+async def index_document_embedding(db: AsyncSession, doc: Document, text: Optional[str] = None):
+    """Embed an analyzed document and append it to the vector index; failures only get logged."""
+    if not EMBEDDINGS_ENABLED:
+        return
+    document_id = doc.id
+    try:
+        if text is None and doc.file_path:
+            text = await get_document_text(db, doc, max_chars=EMBED_TEXT_CHARS)
+        owner, content = doc.uploaded_by or 0, embedding_text(doc, text or "")
+        await release_connection(db)
+        vector = await ollama.embed(content, EMBEDDING_MODEL)
+        await asyncio.get_running_loop().run_in_executor(None, vector_index.add, document_id, owner, vector)
+    except Exception as e:
+        print(f"Embedding error for document {document_id}: {e}")
+
+async def rebuild_vector_index(batch_size: int = 200, concurrency: int = 4) -> int:
+    """Re-embed every document from the documents table into a fresh index; returns rows written."""
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    written = 0
+    last_id = 0
+    async with db_session() as db:
+        with vector_index.rebuilding() as append:
+            while True:
+                docs = (await db.execute(
+                    select(Document).where(Document.id > last_id).order_by(Document.id).limit(batch_size)
+                )).scalars().all()
+                if not docs:
+                    break
+                last_id = docs[-1].id
+
+                # the session cannot be shared between tasks, so read texts first and only overlap Ollama calls
+                texts = {}
+                for doc in docs:
+                    texts[doc.id] = ""
+                    if doc.file_path and os.path.exists(os.path.join(UPLOAD_DIR, doc.file_path)):
+                        try:
+                            texts[doc.id] = await get_document_text(db, doc, max_chars=EMBED_TEXT_CHARS)
+                        except HTTPException as e:
+                            print(f"Text extraction failed for document {doc.id}: {e.detail}")
+
+                async def embed(doc: Document):
+                    async with semaphore:
+                        try:
+                            return doc, await ollama.embed(embedding_text(doc, texts[doc.id]), EMBEDDING_MODEL)
+                        except Exception as e:
+                            print(f"Embedding error for document {doc.id}: {e}")
+                            return doc, None
+
+                results = [(doc, vector) for doc, vector in await asyncio.gather(*(embed(doc) for doc in docs)) if vector is not None]
+                await loop.run_in_executor(
+                    None, append,
+                    [doc.id for doc, _ in results],
+                    [doc.uploaded_by or 0 for doc, _ in results],
+                    [vector for _, vector in results],
+                )
+                written += len(results)
+    return written
@@ -0,0 +1,29 @@
+"""Standalone job worker: `python worker.py` (needs JOB_QUEUE_BACKEND=redis)."""
+import asyncio
+import os
+import signal
+
+# imported for the job handlers they register
+import analysis  # noqa: F401
+import mayan  # noqa: F401
+import previews  # noqa: F401
+from config import AUTO_MIGRATE, JOB_CONCURRENCY, JOB_QUEUE_BACKEND
+from jobs import run_job_workers
+from models import init_database, prepare_storage
+
+
+async def main():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    prepare_storage()
+    if AUTO_MIGRATE:
+        init_database()
+    concurrency = int(os.getenv("JOB_CONCURRENCY", str(JOB_CONCURRENCY)))
+    print(f"Job worker started ({JOB_QUEUE_BACKEND} queue, concurrency={concurrency})")
+    await run_job_workers(concurrency, stop)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
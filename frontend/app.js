@@ -21,15 +21,22 @@ async function logout() {
 }
 
 // ============ DOCUMENTS ============
-async function loadDocuments() {
+// List views only need these columns (file_url goes to downloadDocument()); the next page is fetched with loadDocuments(nextDocumentsCursor)
+const DOCUMENT_LIST_FIELDS = "id,title,uploaded_by,created_at,file_url";
+let nextDocumentsCursor = null;
+
+async function loadDocuments(cursor = null) {
     const token = getToken();
     if (!token) {
         window.location.href = "login.html";
         return;
     }
 
+    const params = new URLSearchParams({ fields: DOCUMENT_LIST_FIELDS });
+    if (cursor) params.set("cursor", cursor);
+
     try {
-        const response = await fetch(`${API_URL}/documents`, {
+        const response = await fetch(`${API_URL}/documents?${params}`, {
             method: "GET",
             headers: {
                 "Authorization": `Bearer ${token}`,
@@ -42,6 +49,7 @@ async function loadDocuments() {
             return;
         }
 
+        nextDocumentsCursor = response.headers.get("X-Next-Cursor");
         const documents = await response.json();
         return documents;
     } catch (error) {
@@ -85,6 +93,58 @@ async function uploadDocument(title, description, file) {
     }
 }
 
+// fileUrl is a document's file_url (/documents/{id}/download), which needs the bearer token,
+// so the file is fetched here and handed to the browser as an object URL.
+async function downloadDocument(fileUrl, filename = null) {
+    const token = getToken();
+    if (!token) {
+        alert("Veuillez vous connecter d'abord");
+        return false;
+    }
+
+    try {
+        const response = await fetch(`${API_URL}${fileUrl}?download=true`, {
+            headers: { "Authorization": `Bearer ${token}` }
+        });
+        if (!response.ok) {
+            alert("Fichier introuvable");
+            return false;
+        }
+        const url = URL.createObjectURL(await response.blob());
+        const link = document.createElement("a");
+        link.href = url;
+        link.download = filename || "";
+        document.body.appendChild(link);
+        link.click();
+        link.remove();
+        setTimeout(() => URL.revokeObjectURL(url), 60000);
+        return true;
+    } catch (error) {
+        console.error("Download error:", error);
+        return false;
+    }
+}
+
+// ============ PREVIEWS ============
+// Object URL for an <img> (page null = thumbnail); null for files without previews (e.g. .docx, .txt).
+// The API sends long-lived cache headers, so repeated calls are answered by the browser cache.
+async function loadPreviewImage(documentId, page = null) {
+    const token = getToken();
+    if (!token) return null;
+
+    const path = page === null ? "thumbnail" : `previews/${page}`;
+    try {
+        const response = await fetch(`${API_URL}/documents/${documentId}/${path}`, {
+            headers: { "Authorization": `Bearer ${token}` }
+        });
+        if (!response.ok) return null;
+        return URL.createObjectURL(await response.blob());
+    } catch (error) {
+        console.error("Preview error:", error);
+        return null;
+    }
+}
+
 // ============ AI ANALYSIS ============
 async function analyzeDocument(documentId, text) {
     const token = getToken();
@@ -118,6 +178,58 @@ async function analyzeDocument(documentId, text) {
     }
 }
 
+// Streams the summary as it is generated: onEvent(name, data) is called for
+// "progress", "summary" ({token}), "keywords", "error" and the final "done".
+async function analyzeDocumentStream(documentId, text, onEvent) {
+    const token = getToken();
+    if (!token) {
+        alert("Veuillez vous connecter d'abord");
+        return null;
+    }
+
+    let url = `${API_URL}/documents/analyze-file/${documentId}/stream`;
+    const options = {
+        method: "POST",
+        headers: { "Authorization": `Bearer ${token}` }
+    };
+    if (text) {
+        const formData = new FormData();
+        formData.append("text", text);
+        url = `${API_URL}/documents/analyze/stream?document_id=${documentId}`;
+        options.body = formData;
+    }
+
+    try {
+        const response = await fetch(url, options);
+        if (!response.ok) {
+            console.error("Analysis failed:", await response.json());
+            return null;
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let result = null;
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let end;
+            while ((end = buffer.indexOf("\n\n")) !== -1) {
+                const block = buffer.slice(0, end);
+                buffer = buffer.slice(end + 2);
+                const name = (block.match(/^event: (.*)$/m) || [])[1];
+                const data = JSON.parse((block.match(/^data: (.*)$/m) || [, "{}"])[1]);
+                if (name === "done") result = data;
+                if (onEvent) onEvent(name, data);
+            }
+        }
+        return result;
+    } catch (error) {
+        console.error("Analysis error:", error);
+        return null;
+    }
+}
+
 // ============ ACCESS CHECK ============
 async function checkAccess() {
     const token = getToken();
@@ -187,6 +299,33 @@ async function createUser(email, password, fullName, role) {
     }
 }
 
+// file: CSV (email,password,full_name,role,windows) or JSON list of users; windows in CSV look like
+// "08:00-12:00@0;14:00-18:00" (weekday after @ optional, 0 = Monday). Returns the per-row report.
+async function importUsers(file) {
+    const token = getToken();
+    if (!token) return null;
+
+    const formData = new FormData();
+    formData.append("file", file);
+
+    try {
+        const response = await fetch(`${API_URL}/users/bulk`, {
+            method: "POST",
+            headers: { "Authorization": `Bearer ${token}` },
+            body: formData
+        });
+        const result = await response.json();
+        if (!response.ok) {
+            alert(result.detail || "Erreur lors de l'import");
+            return null;
+        }
+        return result;
+    } catch (error) {
+        console.error("Import users error:", error);
+        return null;
+    }
+}
+
 async function deleteUser(userId) {
     const token = getToken();
     if (!token) return false;
@@ -226,6 +365,44 @@ async function setAccessWindow(userId, startTime, endTime) {
     }
 }
 
+// windows: [{start_time: "08:00", end_time: "18:00", weekday: 0}] (weekday optional, 0 = Monday)
+async function setAccessWindowsBulk(userIds, windows, replace = true) {
+    const token = getToken();
+    if (!token) return null;
+
+    try {
+        const response = await fetch(`${API_URL}/access-windows/bulk`, {
+            method: "POST",
+            headers: {
+                "Authorization": `Bearer ${token}`,
+                "Content-Type": "application/json"
+            },
+            body: JSON.stringify({ user_ids: userIds, windows: windows, replace: replace })
+        });
+        return response.ok ? await response.json() : null;
+    } catch (error) {
+        console.error("Bulk access window error:", error);
+        return null;
+    }
+}
+
+// ============ MAYAN SYNC ============
+// {counts: {pending, syncing, synced, failed}, recent_failures: [...]}; admins also get client stats
+async function loadMayanSyncStatus() {
+    const token = getToken();
+    if (!token) return null;
+
+    try {
+        const response = await fetch(`${API_URL}/mayan/sync-status`, {
+            headers: { "Authorization": `Bearer ${token}` }
+        });
+        return response.ok ? await response.json() : null;
+    } catch (error) {
+        console.error("Mayan sync status error:", error);
+        return null;
+    }
+}
+
 // ============ PAGE INITIALIZATION ============
 document.addEventListener("DOMContentLoaded", async () => {
     const token = getToken();
@@ -17,6 +17,7 @@ CREATE TABLE access_windows (
     user_id INTEGER NOT NULL,
     start_time VARCHAR(5),
     end_time VARCHAR(5),
+    weekday SMALLINT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id)
 );
@@ -30,9 +31,45 @@ CREATE TABLE documents (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     ai_summary TEXT,
     ai_keywords TEXT,
+    file_size BIGINT,
+    sha256 VARCHAR(64),
+    mayan_status VARCHAR(16) DEFAULT 'pending',
+    mayan_updated_at TIMESTAMP,
+    mayan_error TEXT,
+    search_vector TSVECTOR,
     FOREIGN KEY (uploaded_by) REFERENCES users(id)
 );
 
+CREATE TABLE blobs (
+    sha256 VARCHAR(64) PRIMARY KEY,
+    file_path VARCHAR(255) NOT NULL,
+    file_size BIGINT,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    extracted_text TEXT,
+    page_count INTEGER,
+    extracted_partial BOOLEAN,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE analysis_chunks (
+    key VARCHAR(64) PRIMARY KEY,
+    summary TEXT,
+    keywords TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE analysis_batches (
+    id VARCHAR(32) PRIMARY KEY,
+    created_by INTEGER,
+    document_ids TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    succeeded INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 CREATE TABLE sessions (
     id SERIAL PRIMARY KEY,
     user_id INTEGER NOT NULL,
@@ -45,7 +82,11 @@ CREATE TABLE sessions (
 CREATE INDEX idx_users_email ON users(email);
 CREATE INDEX idx_access_windows_user_id ON access_windows(user_id);
 CREATE INDEX idx_documents_mayan_id ON documents(mayan_id);
-CREATE INDEX idx_documents_uploaded_by ON documents(uploaded_by);
+CREATE INDEX idx_documents_uploaded_by ON documents(uploaded_by, created_at, id);
+CREATE INDEX idx_documents_created_at ON documents(created_at, id);
+CREATE INDEX idx_documents_sha256 ON documents(sha256);
+CREATE INDEX idx_documents_search ON documents USING GIN (search_vector);
+CREATE INDEX idx_documents_mayan_status ON documents(mayan_status, id);
 CREATE INDEX idx_sessions_user_id ON sessions(user_id);
 CREATE INDEX idx_sessions_token ON sessions(token);
 